@@ -1,7 +1,6 @@
 import asyncio
 import logging
-import re
-from typing import Optional, Tuple
+from typing import AsyncIterator, Iterable, Optional, Tuple
 
 # Attempt imports, but anticipate missing dependencies if user hasn't installed them yet
 try:
@@ -16,42 +15,33 @@ try:
 except ImportError:
     HAS_NETMIKO = False
 
+from app.core.netmiko_pool import NetmikoSessionPool, get_netmiko_pool
+from app.core.ssh_pool import SSHConnectionPool, get_ssh_pool
+# Security: rule sets live in app.security.policy (BLACKLISTED_COMMANDS re-exported for callers)
+from app.security.policy import BLACKLISTED_COMMANDS, check_command
+
 logger = logging.getLogger(__name__)
 
-# Security: List of dangerous commands to block
-BLACKLISTED_COMMANDS = [
-    r"rm\s+-rf",
-    r"mkfs",
-    r"dd\s+if=",
-    r":(){:|:&};:",  # Fork bomb
-    r">\s*/dev/sda",
-    r"mv\s+/*\s+/dev/null",
-    r"shutdown",
-    r"reboot",
-    r"init\s+0",
-]
-
-def validate_command(command: str) -> Tuple[bool, str]:
+def validate_command(command: str, os_family: Optional[str] = None) -> Tuple[bool, str]:
     """
-    Validates if a command is safe to execute.
+    Validates if a command is safe to execute on the given OS family.
     Returns (is_safe, reason).
     """
-    if not command or not command.strip():
-        return False, "Empty command"
-
-    for pattern in BLACKLISTED_COMMANDS:
-        if re.search(pattern, command):
-            return False, f"Command contains blacklisted pattern: {pattern}"
-
-    return True, "Safe"
+    return check_command(command, os_family)
 
 class ConnectionManager:
     """
     Manages connections to remote servers via SSH (Linux) or Netmiko (Network).
     """
     
-    def __init__(self, private_key_path: str = None):
+    def __init__(self,
+                 private_key_path: str = None,
+                 ssh_pool: Optional[SSHConnectionPool] = None,
+                 netmiko_pool: Optional[NetmikoSessionPool] = None):
         self.private_key_path = private_key_path
+        # Shared across instances so connections survive between approvals
+        self.ssh_pool = ssh_pool or get_ssh_pool()
+        self.netmiko_pool = netmiko_pool or get_netmiko_pool()
 
     async def execute_ssh_command(self, 
                                 host: str, 
@@ -64,19 +54,78 @@ class ConnectionManager:
         if not HAS_ASYNCSSH:
             return "Error: asyncssh library is not installed."
             
-        is_safe, reason = validate_command(command)
+        is_safe, reason = validate_command(command, 'linux')
         if not is_safe:
             raise ValueError(f"Security Alert: {reason}")
 
-        try:
-            async with asyncssh.connect(host, username=username, port=port, client_keys=[self.private_key_path], known_hosts=None) as conn:
-                result = await conn.run(command)
-                if result.exit_status != 0:
-                    return f"Error (Exit Code {result.exit_status}):\n{result.stderr}"
-                return result.stdout
-        except Exception as e:
-            logger.error(f"SSH Connection failed: {e}")
-            return f"Connection Failed: {str(e)}"
+        # A pooled connection may have been dropped by the server since last use,
+        # so retry once on a fresh connection before giving up.
+        for attempt in range(2):
+            try:
+                async with self.ssh_pool.connection(host, username, port, self.private_key_path) as conn:
+                    result = await conn.run(command)
+                    if result.exit_status != 0:
+                        return f"Error (Exit Code {result.exit_status}):\n{result.stderr}"
+                    return result.stdout
+            except (asyncssh.ConnectionLost, asyncssh.ChannelOpenError) as e:
+                if attempt == 0:
+                    logger.warning(f"Pooled SSH connection to {host} went stale, reconnecting: {e}")
+                    self.ssh_pool.discard((host, username, port, self.private_key_path))
+                    continue
+                logger.error(f"SSH Connection failed: {e}")
+                return f"Connection Failed: {str(e)}"
+            except Exception as e:
+                logger.error(f"SSH Connection failed: {e}")
+                return f"Connection Failed: {str(e)}"
+
+    async def stream_ssh_command(self,
+                                 host: str,
+                                 username: str,
+                                 command: str,
+                                 port: int = 22,
+                                 chunk_size: int = 4096) -> AsyncIterator[str]:
+        """
+        Executes a command on a Linux server and yields output as it is produced.
+        stderr is merged into stdout. Chunks are at most `chunk_size` characters and
+        the remote side is only read when the consumer asks for more, so SSH flow
+        control applies backpressure. Closing the generator terminates the command.
+        """
+        if not HAS_ASYNCSSH:
+            yield "Error: asyncssh library is not installed."
+            return
+
+        is_safe, reason = validate_command(command, 'linux')
+        if not is_safe:
+            raise ValueError(f"Security Alert: {reason}")
+
+        started = False
+        for attempt in range(2):
+            try:
+                async with self.ssh_pool.connection(host, username, port, self.private_key_path) as conn:
+                    async with conn.create_process(command, stderr=asyncssh.STDOUT) as process:
+                        while True:
+                            chunk = await process.stdout.read(chunk_size)
+                            if not chunk:
+                                break
+                            started = True
+                            yield chunk
+                        await process.wait()
+                        if process.exit_status:
+                            yield f"\n[Exit Code {process.exit_status}]"
+                return
+            except (asyncssh.ConnectionLost, asyncssh.ChannelOpenError) as e:
+                # Only a stale pooled connection that never produced output is retried
+                if attempt == 0 and not started:
+                    logger.warning(f"Pooled SSH connection to {host} went stale, reconnecting: {e}")
+                    self.ssh_pool.discard((host, username, port, self.private_key_path))
+                    continue
+                logger.error(f"SSH Connection failed: {e}")
+                yield f"\nConnection Failed: {str(e)}"
+                return
+            except Exception as e:
+                logger.error(f"SSH Connection failed: {e}")
+                yield f"\nConnection Failed: {str(e)}"
+                return
 
     async def execute_netmiko_command(self, 
                                     host: str, 
@@ -90,33 +139,25 @@ class ConnectionManager:
         if not HAS_NETMIKO:
             return "Error: Netmiko library is not installed."
 
-        is_safe, reason = validate_command(command)
+        is_safe, reason = validate_command(command, device_type)
         if not is_safe:
             raise ValueError(f"Security Alert: {reason}")
             
-        # Netmiko is blocking, so we run it in a thread executor
-        def _run_netmiko():
-            try:
-                # Note: Netmiko usually requires a password or key. 
-                # Integrating with key might depend on device support.
-                # Use use_keys=True and key_file
-                connection_params = {
-                    'device_type': device_type,
-                    'host': host,
-                    'username': username,
-                    'port': port,
-                    'use_keys': True,
-                    'key_file': self.private_key_path,
-                    # 'ssh_config_file': '~/.ssh/config', # Optional
-                }
-                
-                with ConnectHandler(**connection_params) as net_connect:
-                    return net_connect.send_command(command)
-            except Exception as e:
-                return f"Netmiko Failed: {str(e)}"
+        # Note: Netmiko usually requires a password or key. 
+        # Integrating with key might depend on device support.
+        # Use use_keys=True and key_file
+        connection_params = {
+            'device_type': device_type,
+            'host': host,
+            'username': username,
+            'port': port,
+            'use_keys': True,
+            'key_file': self.private_key_path,
+            # 'ssh_config_file': '~/.ssh/config', # Optional
+        }
 
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, _run_netmiko)
+        # Netmiko is blocking; the pool runs it on its own executor and keeps sessions warm
+        return await self.netmiko_pool.send_command(connection_params, command)
 
     async def execute(self, device, command: str) -> str:
         """
@@ -142,3 +183,65 @@ class ConnectionManager:
             )
         else:
             return f"Unsupported OS Family: {device.os_family}"
+
+    async def execute_stream(self, device, command: str, chunk_size: int = 4096) -> AsyncIterator[str]:
+        """
+        Streaming variant of `execute`. Linux hosts stream output incrementally;
+        Netmiko has no incremental API, so network devices yield their full
+        output once the command completes, split into bounded chunks.
+        """
+        if device.os_family == 'linux' and self.private_key_path:
+            async for chunk in self.stream_ssh_command(
+                host=device.ip_address,
+                username=device.ssh_user,
+                port=device.ssh_port,
+                command=command,
+                chunk_size=chunk_size
+            ):
+                yield chunk
+            return
+
+        result = await self.execute(device, command)
+        for i in range(0, len(result), chunk_size):
+            yield result[i:i + chunk_size]
+
+    async def execute_many(self,
+                           devices: Iterable,
+                           command: str,
+                           concurrency: int = 20,
+                           timeout: float = 60.0) -> AsyncIterator[Tuple[object, str]]:
+        """
+        Runs the same command on many devices concurrently.
+        At most `concurrency` hosts run at once and each host gets its own `timeout`,
+        so one slow box never stalls the rest.
+        Yields (device, result) tuples in completion order. Closing the generator
+        early cancels every host that has not finished yet.
+        """
+        devices = list(devices)
+        # Reject the whole fan-out up front instead of failing host by host
+        for os_family in {device.os_family for device in devices}:
+            is_safe, reason = validate_command(command, os_family)
+            if not is_safe:
+                raise ValueError(f"Security Alert: {reason}")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run(device):
+            async with semaphore:
+                try:
+                    return device, await asyncio.wait_for(self.execute(device, command), timeout)
+                except asyncio.TimeoutError:
+                    return device, f"Timeout: no result after {timeout:g}s"
+                except Exception as e:
+                    logger.error(f"Fan-out execution failed on {getattr(device, 'hostname', device)}: {e}")
+                    return device, f"Error: {str(e)}"
+
+        tasks = [asyncio.create_task(_run(device)) for device in devices]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
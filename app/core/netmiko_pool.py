@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+try:
+    from netmiko import ConnectHandler
+    HAS_NETMIKO = True
+except ImportError:
+    HAS_NETMIKO = False
+
+logger = logging.getLogger(__name__)
+
+# (device_type, host, username, port, key_file)
+SessionKey = Tuple[str, str, str, int, Optional[str]]
+
+
+class _NetmikoSession:
+    """A warm Netmiko connection plus the lock that serializes its use."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connection = None
+        self.last_used = time.monotonic()
+
+    def is_alive(self) -> bool:
+        if self.connection is None:
+            return False
+        try:
+            return self.connection.is_alive()
+        except Exception:
+            return False
+
+    def disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.disconnect()
+            except Exception as e:
+                logger.debug(f"Error closing Netmiko session: {e}")
+            self.connection = None
+
+
+class NetmikoSessionPool:
+    """
+    Keeps Netmiko sessions warm per device on a dedicated thread pool.
+
+    Netmiko is blocking and its session preparation (prompt detection,
+    terminal length/width) takes seconds, so sessions are reused across
+    commands. Each session is used by one thread at a time; sessions idle
+    for longer than `idle_timeout` are disconnected by a reaper thread that
+    runs while the pool holds sessions (so an idle app frees its VTY lines).
+    """
+
+    def __init__(self,
+                 max_workers: int = 8,
+                 idle_timeout: float = 300.0,
+                 max_sessions: int = 32,
+                 reap_interval: Optional[float] = None):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval or min(idle_timeout / 2, 30.0)
+        # Separate from the loop's default executor so slow network gear
+        # cannot starve other blocking calls in the app.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="netmiko")
+        self._sessions: dict[SessionKey, _NetmikoSession] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    def _evict_idle(self, reserve: int = 0):
+        """Disconnects idle sessions; `reserve` frees room for sessions about to be opened."""
+        now = time.monotonic()
+        with self._lock:
+            idle = sorted(self._sessions.items(), key=lambda item: item[1].last_used)
+            overflow = max(0, len(idle) - self.max_sessions + reserve)
+            victims = []
+            for i, (key, session) in enumerate(idle):
+                if (now - session.last_used) <= self.idle_timeout and i >= overflow:
+                    continue
+                # Skip sessions that are busy right now
+                if session.lock.acquire(blocking=False):
+                    victims.append(session)
+                    del self._sessions[key]
+        for session in victims:
+            session.disconnect()
+            session.lock.release()
+
+    def _reap(self):
+        """Reaper thread: enforces idle_timeout between commands, exits once the pool is empty."""
+        while not self._closed.wait(self.reap_interval):
+            self._evict_idle()
+            with self._lock:
+                if not self._sessions:
+                    self._reaper = None
+                    return
+
+    def _get_session(self, key: SessionKey) -> _NetmikoSession:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = _NetmikoSession()
+                self._sessions[key] = session
+            if self._reaper is None and not self._closed.is_set():
+                self._reaper = threading.Thread(target=self._reap, name="netmiko-reaper", daemon=True)
+                self._reaper.start()
+            return session
+
+    def _send_blocking(self, key: SessionKey, connection_params: dict, command: str) -> str:
+        self._evict_idle(reserve=1)
+        while True:
+            session = self._get_session(key)
+            with session.lock:
+                # Evicted while we were waiting for the lock; pick up the replacement
+                if self._sessions.get(key) is not session:
+                    continue
+                # A reused session may have been dropped by the device; retry once fresh
+                reused = session.is_alive()
+                for _ in range(2):
+                    try:
+                        if not session.is_alive():
+                            session.disconnect()
+                            session.connection = ConnectHandler(**connection_params)
+                            logger.info(f"Opened Netmiko session to {key[2]}@{key[1]}:{key[3]}")
+                        output = session.connection.send_command(command)
+                        session.last_used = time.monotonic()
+                        return output
+                    except Exception as e:
+                        session.disconnect()
+                        if reused:
+                            reused = False
+                            logger.warning(f"Pooled Netmiko session to {key[1]} failed, reconnecting: {e}")
+                            continue
+                        return f"Netmiko Failed: {str(e)}"
+
+    async def send_command(self, connection_params: dict, command: str) -> str:
+        """
+        Runs `command` on a pooled session for the device described by `connection_params`.
+        """
+        key = (
+            connection_params['device_type'],
+            connection_params['host'],
+            connection_params['username'],
+            connection_params.get('port', 22),
+            connection_params.get('key_file'),
+        )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._send_blocking, key, connection_params, command)
+
+    def close(self):
+        """Disconnects every session and stops the worker and reaper threads."""
+        self._closed.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.disconnect()
+        self._executor.shutdown(wait=False)
+
+
+_default_pool: Optional[NetmikoSessionPool] = None
+
+
+def get_netmiko_pool() -> NetmikoSessionPool:
+    """Returns the process-wide Netmiko pool shared by all ConnectionManager instances."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = NetmikoSessionPool(
+            max_workers=int(os.getenv("NETMIKO_POOL_WORKERS", "8")),
+            idle_timeout=float(os.getenv("NETMIKO_POOL_IDLE_TIMEOUT", "300")),
+        )
+    return _default_pool
+
+
+def close_netmiko_pool():
+    """Closes the process-wide pool if it was created (application shutdown)."""
+    global _default_pool
+    if _default_pool is not None:
+        _default_pool.close()
+        _default_pool = None
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple
+
+try:
+    import asyncssh
+    HAS_ASYNCSSH = True
+except ImportError:
+    HAS_ASYNCSSH = False
+
+logger = logging.getLogger(__name__)
+
+# (host, username, port, private_key_path)
+PoolKey = Tuple[str, str, int, Optional[str]]
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper around a live asyncssh connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.in_use = 0
+
+    def is_alive(self) -> bool:
+        return not self.conn.is_closed()
+
+    def is_expired(self, now: float, idle_timeout: float, max_age: float) -> bool:
+        if self.in_use:
+            return False
+        return (now - self.last_used) > idle_timeout or (now - self.created_at) > max_age
+
+
+class SSHConnectionPool:
+    """
+    Keeps authenticated asyncssh connections alive between commands.
+
+    Connections are keyed by (host, user, port, key) and shared between
+    concurrent callers (SSH multiplexes sessions over one connection).
+    Idle and too-old connections are evicted on every acquire and by a
+    reaper task that runs while the pool holds connections; the least
+    recently used idle connection is dropped when a new one needs room.
+    """
+
+    def __init__(self,
+                 max_size: int = 32,
+                 idle_timeout: float = 300.0,
+                 max_age: float = 3600.0,
+                 keepalive_interval: float = 30.0,
+                 connect_timeout: float = 15.0,
+                 reap_interval: Optional[float] = None):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.reap_interval = reap_interval or min(idle_timeout / 2, 30.0)
+
+        self._entries: "OrderedDict[PoolKey, _PooledConnection]" = OrderedDict()
+        self._connect_locks: dict[PoolKey, asyncio.Lock] = {}
+        self._key_cache: dict[str, tuple] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _load_client_keys(self, private_key_path: Optional[str]):
+        """Parses the private key once per (path, mtime) instead of on every connect."""
+        if not private_key_path:
+            return None
+        mtime = os.path.getmtime(private_key_path)
+        cached = self._key_cache.get(private_key_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        keys = [asyncssh.read_private_key(private_key_path)]
+        self._key_cache[private_key_path] = (mtime, keys)
+        return keys
+
+    async def _open(self, key: PoolKey):
+        host, username, port, private_key_path = key
+        return await asyncssh.connect(
+            host,
+            username=username,
+            port=port,
+            client_keys=self._load_client_keys(private_key_path),
+            known_hosts=None,
+            keepalive_interval=self.keepalive_interval,
+            keepalive_count_max=3,
+            connect_timeout=self.connect_timeout,
+        )
+
+    def _close_entry(self, entry: _PooledConnection):
+        try:
+            entry.conn.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled SSH connection: {e}")
+
+    def _drop(self, key: PoolKey):
+        """Closes the connection for `key` and forgets its connect lock unless a handshake holds it."""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._close_entry(entry)
+        lock = self._connect_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._connect_locks[key]
+
+    def _evict(self):
+        """Drops dead and expired idle connections."""
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if not entry.is_alive() or entry.is_expired(now, self.idle_timeout, self.max_age):
+                self._drop(key)
+
+    def _make_room(self):
+        """Drops least recently used idle connections so one more fits in max_size."""
+        while len(self._entries) >= self.max_size:
+            victim = next((k for k, e in self._entries.items() if not e.in_use), None)
+            if victim is None:
+                break
+            self._drop(victim)
+
+    async def _reap(self):
+        """Reaper task: enforces idle_timeout/max_age between commands, exits once the pool is empty."""
+        try:
+            while self._entries:
+                await asyncio.sleep(self.reap_interval)
+                self._evict()
+        finally:
+            self._reaper = None
+
+    def _ensure_reaper(self):
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def acquire(self, key: PoolKey) -> _PooledConnection:
+        self._evict()
+
+        entry = self._entries.get(key)
+        if entry and entry.is_alive():
+            self._entries.move_to_end(key)
+            entry.in_use += 1
+            return entry
+
+        # Serialize handshakes per key so a burst of commands opens one connection
+        lock = self._connect_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                entry = self._entries.get(key)
+                if not entry or not entry.is_alive():
+                    conn = await self._open(key)
+                    if entry:
+                        self._close_entry(entry)
+                    else:
+                        # Only a new key needs room; a reconnect replaces its own entry
+                        self._make_room()
+                    entry = _PooledConnection(conn)
+                    self._entries[key] = entry
+                    logger.info(f"Opened pooled SSH connection to {key[1]}@{key[0]}:{key[2]}")
+                    self._ensure_reaper()
+                self._entries.move_to_end(key)
+                entry.in_use += 1
+                return entry
+        finally:
+            # Failed handshakes must not leave a lock behind for a key with no connection
+            if key not in self._entries and not lock.locked() and self._connect_locks.get(key) is lock:
+                del self._connect_locks[key]
+
+    def release(self, entry: _PooledConnection):
+        entry.in_use = max(0, entry.in_use - 1)
+        entry.last_used = time.monotonic()
+
+    def discard(self, key: PoolKey):
+        """Removes a connection that turned out to be broken."""
+        self._drop(key)
+
+    @asynccontextmanager
+    async def connection(self,
+                         host: str,
+                         username: str,
+                         port: int = 22,
+                         private_key_path: Optional[str] = None):
+        """
+        Yields a live connection for the target, reusing a pooled one if possible.
+        """
+        key = (host, username, port, private_key_path)
+        entry = await self.acquire(key)
+        try:
+            yield entry.conn
+        except (asyncssh.ConnectionLost, asyncssh.DisconnectError, OSError):
+            self.discard(key)
+            raise
+        finally:
+            self.release(entry)
+
+    async def close(self):
+        """Closes every pooled connection (e.g. on application shutdown)."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        entries = list(self._entries.values())
+        self._entries.clear()
+        self._connect_locks.clear()
+        for entry in entries:
+            self._close_entry(entry)
+        for entry in entries:
+            try:
+                await entry.conn.wait_closed()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "in_use": sum(1 for e in self._entries.values() if e.in_use),
+            "max_size": self.max_size,
+        }
+
+
+_default_pool: Optional[SSHConnectionPool] = None
+
+
+def get_ssh_pool() -> SSHConnectionPool:
+    """Returns the process-wide SSH pool shared by all ConnectionManager instances."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = SSHConnectionPool(
+            max_size=int(os.getenv("SSH_POOL_MAX_SIZE", "32")),
+            idle_timeout=float(os.getenv("SSH_POOL_IDLE_TIMEOUT", "300")),
+            max_age=float(os.getenv("SSH_POOL_MAX_AGE", "3600")),
+        )
+    return _default_pool
+
+
+async def close_ssh_pool():
+    """Closes the process-wide pool if it was created (application shutdown)."""
+    global _default_pool
+    if _default_pool is not None:
+        await _default_pool.close()
+        _default_pool = None
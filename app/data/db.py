@@ -0,0 +1,52 @@
+import os
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+# PRAGMAs applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    # Readers (chat sessions) no longer block on an import/sync writer
+    "journal_mode": "WAL",
+    # Safe with WAL; fsync only at checkpoints
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative = KiB, i.e. 64 MB page cache per connection
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "65536")),
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+_engines: dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def get_engine(db_path: str) -> Engine:
+    """
+    Process-wide engine for a SQLite file, created on first use.
+    All repositories on the same file share its connection pool.
+    """
+    key = os.path.abspath(db_path)
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_engine(f"sqlite:///{key}", echo=False)
+                event.listen(engine, "connect", _set_sqlite_pragmas)
+                _engines[key] = engine
+    return engine
+
+
+def dispose_engines():
+    """Closes all pooled connections (tests, forked workers)."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
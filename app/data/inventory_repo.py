@@ -1,7 +1,298 @@
 import os
-from sqlalchemy import create_engine, select
+import re
+import json
+import time
+import operator
+import functools
+import hashlib
+import threading
+from sqlalchemy import bindparam, delete, exists, func, insert, select, update
 from sqlalchemy.orm import Session, selectinload
-from app.data.models import Base, Device, Component
+from app.data.db import get_engine
+from app.data.models import Base, Device, Component, DeviceSpec
+
+# Columns mapped onto Device fields; everything else goes into extra_specs
+IMPORT_FIELDS = ('hostname', 'ip_address', 'model', 'serial_number', 'location', 'device_type', 'os_family', 'auth_method', 'ssh_user', 'ssh_port')
+# NOT NULL columns without a default
+REQUIRED_IMPORT_FIELDS = ('hostname', 'model', 'serial_number', 'location')
+# Rows per CSV chunk (one existence query + one executemany each)
+IMPORT_CHUNK_ROWS = 5000
+# Bump when initialize_db gains a migration; stored in PRAGMA user_version
+#   1: initial schema
+#   2: devices.fingerprint
+#   3: device_specs (extra_specs as indexed key/value rows)
+#   4: device_specs.num re-parsed (model numbers are no longer quantities)
+SCHEMA_VERSION = 4
+# Seconds before the device index is reloaded anyway (picks up writes from other processes)
+DEVICE_INDEX_TTL = float(os.getenv("INVENTORY_INDEX_TTL", "60"))
+# Everything an import writes; a change in any of these changes the fingerprint
+FINGERPRINT_COLUMNS = [getattr(Device, f) for f in IMPORT_FIELDS + ('extra_specs',)]
+
+# Device columns usable as equality filters in find_devices / spec_stats
+DEVICE_FILTER_FIELDS = ('hostname', 'ip_address', 'model', 'serial_number', 'location', 'device_type', 'os_family', 'auth_method', 'ssh_user')
+_SPEC_COMPARISONS = {
+    "=": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+SPEC_OPERATORS = tuple(_SPEC_COMPARISONS) + ("between", "contains", "exists")
+
+# Units that make a number inside free text meaningful; sizes are normalized to GB
+_SPEC_UNIT = r"(?:([kmgtp])i?b|w|[gm]hz|cores?|threads?|rpm)(?![\w])"
+# Number, optionally with a unit, that is a whole token ("512GB", "1.92 TB", "48"; not "4210U")
+_SPEC_NUMBER = rf"(\d+(?:[.,]\d+)?)\s*(?:{_SPEC_UNIT})?(?![\w.,-])"
+_SPEC_MULTIPLIED_RE = re.compile(rf"^\s*(\d+)\s*[x×]\s*{_SPEC_NUMBER}", re.IGNORECASE)  # "8x 32GB"
+_SPEC_COUNT_RE = re.compile(r"^\s*(\d+)\s*[x×](?![\w])", re.IGNORECASE)  # "2x Xeon Gold 6248"
+_SPEC_LEADING_RE = re.compile(rf"^\s*{_SPEC_NUMBER}", re.IGNORECASE)  # "512GB", "48 ports"
+_SPEC_WITH_UNIT_RE = re.compile(rf"(?<![\w.,-])(\d+(?:[.,]\d+)?)\s*{_SPEC_UNIT}", re.IGNORECASE)  # "DDR4 256GB"
+_SIZE_TO_GB = {"k": 1 / 1024 ** 2, "m": 1 / 1024, "g": 1, "t": 1024, "p": 1024 ** 2}
+
+@functools.lru_cache(maxsize=1024)
+def spec_key(name: str) -> str:
+    """extra_specs key for a CSV column / user-supplied attribute name."""
+    return name.strip().lower().replace(" ", "_")
+
+def _spec_amount(number: str, unit: str | None) -> float:
+    value = float(number.replace(",", "."))
+    return value * _SIZE_TO_GB[unit.lower()] if unit else value
+
+@functools.lru_cache(maxsize=4096)
+def parse_spec_number(value) -> float | None:
+    """
+    Numeric value of a free-text attribute: a leading count, a leading number
+    or a number with a unit, e.g. "512GB" -> 512, "1TB" -> 1024, "8x 32GB" -> 256,
+    "2x Xeon Gold 6248" -> 2, "DDR4 256GB" -> 256, "800W" -> 800.
+    None otherwise: model numbers are not quantities ("Xeon Silver 4210").
+    """
+    text = str(value)
+    match = _SPEC_MULTIPLIED_RE.match(text)
+    if match:
+        return int(match.group(1)) * _spec_amount(match.group(2), match.group(3))
+    match = _SPEC_COUNT_RE.match(text)
+    if match:
+        return float(match.group(1))
+    match = _SPEC_LEADING_RE.match(text) or _SPEC_WITH_UNIT_RE.search(text)
+    if match:
+        return _spec_amount(match.group(1), match.group(2))
+    return None
+
+def _spec_rows(device_id: int, extra_specs: str | None) -> list[dict]:
+    """device_specs rows for one device's extra_specs JSON."""
+    if not extra_specs:
+        return []
+    rows = []
+    for key, value in json.loads(extra_specs).items():
+        if value is None or not str(value).strip():
+            continue
+        value = str(value).strip()
+        rows.append({"device_id": device_id, "key": spec_key(key), "value": value, "num": parse_spec_number(value)})
+    return rows
+
+def _write_specs(conn, devices, replace: bool = False):
+    """
+    Writes the device_specs rows for (device_id, extra_specs) pairs.
+    With `replace` the devices' existing rows are deleted first.
+    """
+    devices = list(devices)
+    if replace:
+        ids = [device_id for device_id, _ in devices]
+        for i in range(0, len(ids), 500):
+            conn.execute(delete(DeviceSpec).where(DeviceSpec.device_id.in_(ids[i:i + 500])))
+    rows = [row for device_id, extra_specs in devices for row in _spec_rows(device_id, extra_specs)]
+    if rows:
+        conn.execute(insert(DeviceSpec), rows)
+
+def _spec_condition(spec_filter: tuple):
+    """
+    Device.id IN (...) clause for one (key, operator[, value]) filter; see SPEC_OPERATORS.
+    Uncorrelated, so SQLite answers it from the (key, num) / (key, value) indexes.
+    """
+    key, op, *rest = spec_filter
+    value = rest[0] if rest else None
+    conditions = [DeviceSpec.key == spec_key(key)]
+    if op == "exists":
+        pass
+    elif op == "between":
+        if not isinstance(value, (tuple, list)) or len(value) != 2:
+            raise ValueError(f"Operator 'between' expects a (low, high) pair, got {value!r}")
+        low, high = value
+        conditions.append(DeviceSpec.num.between(low, high))
+    elif op == "contains":
+        conditions.append(DeviceSpec.value.contains(str(value), autoescape=True))
+    elif op in _SPEC_COMPARISONS:
+        # Numbers compare the parsed value, anything else the text (case-insensitive)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            conditions.append(_SPEC_COMPARISONS[op](DeviceSpec.num, value))
+        else:
+            conditions.append(_SPEC_COMPARISONS[op](DeviceSpec.value, str(value)))
+    else:
+        raise ValueError(f"Unknown operator '{op}', expected one of {SPEC_OPERATORS}")
+    return Device.id.in_(select(DeviceSpec.device_id).where(*conditions))
+
+def _device_conditions(filters: dict) -> list:
+    conditions = []
+    for field, value in filters.items():
+        if field not in DEVICE_FILTER_FIELDS:
+            raise ValueError(f"Unknown device filter '{field}', expected one of {DEVICE_FILTER_FIELDS}")
+        conditions.append(getattr(Device, field) == value)
+    return conditions
+
+def device_fingerprint(values) -> str:
+    """sha256 over the imported fields of one device (CSV record or DB row)."""
+    payload = json.dumps([values[f] for f in IMPORT_FIELDS + ('extra_specs',)], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _column_lists(df) -> dict:
+    """{column: list of values} with NaN turned into None (fast path for executemany)."""
+    return {c: df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns}
+
+def _reject(reason, mask, text):
+    """Sets `text` as the rejection reason where `mask` is true and no reason is set yet."""
+    return reason.mask(reason.isna() & mask, text)
+
+def _iter_csv_chunks(csv_path: str, chunk_size: int):
+    """
+    Reads the CSV in chunks and validates what can be checked without the DB.
+    Yields {"df", "reason" (None = valid so far), "ssh_port", "extra_columns"}.
+    """
+    import pandas as pd
+
+    seen_hostnames = set()
+    seen_serials = set()
+    for df in pd.read_csv(csv_path, dtype=str, chunksize=chunk_size, skipinitialspace=True):
+        # Normalize column names to lowercase/stripped
+        df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+        for field in IMPORT_FIELDS:
+            if field not in df.columns:
+                df[field] = None
+            else:
+                # Whitespace-only cells count as missing. mask(), not
+                # replace("", None): on pandas < 3 that pads from the previous row
+                values = df[field].str.strip()
+                df[field] = values.mask(values == "")
+
+        ssh_port = pd.to_numeric(df["ssh_port"], errors="coerce")
+        reason = pd.Series(None, index=df.index, dtype=object)
+        for field in REQUIRED_IMPORT_FIELDS:
+            reason = _reject(reason, df[field].isna(), f"missing {field}")
+        reason = _reject(reason, df["ssh_port"].notna() & ssh_port.isna(), "invalid ssh_port")
+        reason = _reject(reason, df["hostname"].duplicated(keep="first") | df["hostname"].isin(seen_hostnames),
+                         "duplicate hostname in file")
+        reason = _reject(reason, df["serial_number"].duplicated(keep="first") | df["serial_number"].isin(seen_serials),
+                         "duplicate serial_number in file")
+
+        valid = reason.isna()
+        seen_hostnames.update(df.loc[valid, "hostname"])
+        seen_serials.update(df.loc[valid, "serial_number"])
+        yield {
+            "df": df,
+            "reason": reason,
+            "ssh_port": ssh_port,
+            "extra_columns": [c for c in df.columns if c not in IMPORT_FIELDS],
+        }
+
+def _chunk_records(chunk: dict, valid) -> list[dict]:
+    """Device rows (with defaults, extra_specs and fingerprint) for the valid rows of a chunk."""
+    df, extra_columns = chunk["df"], chunk["extra_columns"]
+    rows = df.loc[valid, list(IMPORT_FIELDS)].copy()
+    rows["device_type"] = rows["device_type"].fillna("Server")
+    rows["os_family"] = rows["os_family"].fillna("linux")
+    rows["auth_method"] = rows["auth_method"].fillna("ssh_key")
+    rows["ssh_port"] = chunk["ssh_port"][valid].fillna(22).astype(int)
+    if extra_columns:
+        extras = _column_lists(df.loc[valid, extra_columns])
+        specs = [
+            {k: v for k, v in zip(extras, values) if v is not None}
+            for values in zip(*extras.values())
+        ]
+        rows["extra_specs"] = [json.dumps(spec) if spec else None for spec in specs]
+    else:
+        rows["extra_specs"] = None
+
+    columns = _column_lists(rows)
+    records = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    for record in records:
+        record["fingerprint"] = device_fingerprint(record)
+    return records
+
+def _csv_lines(df, mask) -> list[int]:
+    """CSV line numbers of the masked rows (header is line 1; the index continues across chunks)."""
+    return [int(i) + 2 for i in df.index[mask]]
+
+def _rejections(df, reason) -> list[dict]:
+    rejected = reason.notna()
+    return [
+        {"row": line, "hostname": hostname, "reason": text}
+        for line, hostname, text in zip(
+            _csv_lines(df, rejected), _column_lists(df.loc[rejected, ["hostname"]])["hostname"], reason[rejected]
+        )
+    ]
+
+class DeviceIndex:
+    """
+    In-memory snapshot of all devices (detached, read-only) keyed by
+    hostname, IP address and serial number.
+
+    Loaded with one query on first use; invalidate() after every write made
+    through the repository. Writes from other processes (CLI import/sync)
+    are picked up after `ttl` seconds.
+    """
+
+    def __init__(self, engine, ttl: float = DEVICE_INDEX_TTL):
+        self.engine = engine
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _load(self) -> dict:
+        with Session(self.engine) as session:
+            devices = list(session.scalars(select(Device).order_by(Device.id)).all())
+        by_ip = {}
+        for d in devices:
+            # IPs are not unique (NAT, lab copies): the oldest device wins
+            if d.ip_address:
+                by_ip.setdefault(d.ip_address, d)
+        return {
+            "devices": devices,
+            "hostname": {d.hostname: d for d in devices},
+            "ip_address": by_ip,
+            "serial_number": {d.serial_number: d for d in devices},
+        }
+
+    def snapshot(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+                    snapshot = self._snapshot = self._load()
+                    self._loaded_at = time.monotonic()
+        return snapshot
+
+    def devices(self) -> list[Device]:
+        return list(self.snapshot()["devices"])
+
+    def get(self, field: str, value: str) -> Device | None:
+        return self.snapshot()[field].get(value)
+
+# Database files whose schema is known to be current in this process
+_initialized: set[str] = set()
+_initialize_lock = threading.Lock()
+
+_device_indexes: dict[str, DeviceIndex] = {}
+_device_indexes_lock = threading.Lock()
+
+def _device_index(engine) -> DeviceIndex:
+    """One index per engine, i.e. per database file and process."""
+    with _device_indexes_lock:
+        index = _device_indexes.get(str(engine.url))
+        if index is None:
+            index = _device_indexes[str(engine.url)] = DeviceIndex(engine)
+        return index
 
 class InventoryRepository:
     def __init__(self, db_path: str = "inventory.db"):
@@ -9,11 +300,39 @@ class InventoryRepository:
         # If db_path is just a filename, it will be in the current working directory
         # We might want to make it absolute relative to the app root in a real scenario
         self.db_url = f"sqlite:///{db_path}"
-        self.engine = create_engine(self.db_url, echo=False)
+        # Shared per database file, so creating a repository is cheap
+        self.engine = get_engine(db_path)
+        self.device_index = _device_index(self.engine)
 
     def initialize_db(self):
-        """Creates the database tables if they do not exist."""
-        Base.metadata.create_all(self.engine)
+        """
+        Creates the database tables if they do not exist and runs pending migrations.
+        Meant to run once per process (app startup, scripts); after that it is
+        a no-op, and an up-to-date database costs a single PRAGMA read.
+        """
+        key = str(self.engine.url)
+        if key in _initialized:
+            return
+        with _initialize_lock:
+            if key in _initialized:
+                return
+            with self.engine.begin() as conn:
+                version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+                if version < SCHEMA_VERSION:
+                    print(f"[INVENTORY] Upgrading schema v{version} -> v{SCHEMA_VERSION}")
+                    Base.metadata.create_all(conn)
+                    # Databases created before sync_from_csv existed
+                    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(devices)")}
+                    if "fingerprint" not in columns:
+                        conn.exec_driver_sql("ALTER TABLE devices ADD COLUMN fingerprint VARCHAR(64)")
+                    if version < 4:
+                        # (Re)build device_specs from extra_specs with the current parser
+                        _write_specs(conn, conn.execute(
+                            select(Device.id, Device.extra_specs).where(Device.extra_specs.is_not(None))
+                        ).all(), replace=True)
+                    conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            _initialized.add(key)
+        self.device_index.invalidate()
 
     def add_device(self, 
                    hostname: str, 
@@ -60,75 +379,245 @@ class InventoryRepository:
 
             session.add(new_device)
             session.commit()
+            self.device_index.invalidate()
             
             # Eager load components so they are available after session close
             stmt = select(Device).options(selectinload(Device.components)).where(Device.id == new_device.id)
             return session.scalars(stmt).one()
 
     def get_all_devices(self) -> list[Device]:
-        """Returns all devices."""
+        """Returns all devices (from the device index; components are not loaded)."""
+        return self.device_index.devices()
+
+    def has_devices(self) -> bool:
+        """True if the inventory has at least one device (EXISTS, no table scan)."""
+        with self.engine.connect() as conn:
+            return conn.execute(select(exists().where(Device.id.is_not(None)))).scalar()
+
+    def get_models(self) -> list[str]:
+        """Distinct device models (used to tag knowledge base documents)."""
         with Session(self.engine) as session:
-            stmt = select(Device)
+            stmt = select(Device.model).where(Device.model.is_not(None)).distinct()
             return list(session.scalars(stmt).all())
 
     def get_device_by_hostname(self, hostname: str) -> Device | None:
         """Finds a device by hostname."""
+        return self.device_index.get("hostname", hostname)
+
+    def get_device_by_ip(self, ip_address: str) -> Device | None:
+        """Finds a device by IP address."""
+        return self.device_index.get("ip_address", ip_address)
+
+    def get_device_by_serial(self, serial_number: str) -> Device | None:
+        """Finds a device by serial number."""
+        return self.device_index.get("serial_number", serial_number)
+
+    def resolve_device(self, identifier: str) -> Device | None:
+        """Finds a device by hostname, IP address or serial number (in that order)."""
+        identifier = (identifier or "").strip()
+        return (self.get_device_by_hostname(identifier)
+                or self.get_device_by_ip(identifier)
+                or self.get_device_by_serial(identifier))
+
+    def find_devices(self, spec_filters: list[tuple] = (), limit: int | None = None, **filters) -> list[Device]:
+        """
+        Devices matching all filters, evaluated in SQL on the indexed device_specs table.
+
+        spec_filters: (key, operator, value) tuples, see SPEC_OPERATORS, e.g.
+            [("ram", ">", 256), ("cpu", "contains", "xeon"), ("psu", "exists")]
+            Numeric values compare the parsed number (sizes in GB),
+            strings compare the raw text case-insensitively;
+            "between" takes a (low, high) tuple.
+        filters: equality on Device columns (DEVICE_FILTER_FIELDS), e.g. device_type="Server".
+        """
+        stmt = (
+            select(Device)
+            .where(*_device_conditions(filters), *(_spec_condition(f) for f in spec_filters))
+            .order_by(Device.id)
+            .limit(limit)
+        )
         with Session(self.engine) as session:
-            stmt = select(Device).where(Device.hostname == hostname)
-            return session.scalars(stmt).first()
+            return list(session.scalars(stmt).all())
+
+    def spec_stats(self, key: str, group_by: str | None = None, spec_filters: list[tuple] = (), **filters) -> list[dict]:
+        """
+        Aggregates of one numeric attribute over the devices that have it,
+        optionally per value of a Device column (e.g. group_by="location").
 
-    def bulk_import_from_csv(self, csv_path: str) -> int:
+        Returns [{"group", "devices", "min", "max", "avg", "sum"}] ("group" is None
+        without group_by). Filters work as in find_devices.
+        """
+        if group_by is not None and group_by not in DEVICE_FILTER_FIELDS:
+            raise ValueError(f"Unknown group_by '{group_by}', expected one of {DEVICE_FILTER_FIELDS}")
+        aggregates = [
+            # Devices with a numeric value, i.e. the ones min/max/avg/sum are over
+            func.count(DeviceSpec.num).label("devices"),
+            func.min(DeviceSpec.num).label("min"),
+            func.max(DeviceSpec.num).label("max"),
+            func.avg(DeviceSpec.num).label("avg"),
+            func.sum(DeviceSpec.num).label("sum"),
+        ]
+        group = getattr(Device, group_by).label("group") if group_by else None
+        stmt = (
+            select(*([group] if group is not None else []), *aggregates)
+            .join(Device, Device.id == DeviceSpec.device_id)
+            .where(DeviceSpec.key == spec_key(key), *_device_conditions(filters),
+                   *(_spec_condition(f) for f in spec_filters))
+        )
+        if group is not None:
+            stmt = stmt.group_by(group).order_by(group)
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).mappings().all()
+        # Without group_by an empty match still yields one all-NULL row
+        return [{"group": row.get("group"), **{a.name: row[a.name] for a in aggregates}} for row in rows if row["devices"]]
+
+    def spec_keys(self) -> dict[str, int]:
+        """All extra_specs attribute names with the number of devices that have them."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(DeviceSpec.key, func.count()).group_by(DeviceSpec.key).order_by(DeviceSpec.key)
+            ).all()
+        return dict(rows)
+
+    def bulk_import_from_csv(self, csv_path: str, chunk_size: int = IMPORT_CHUNK_ROWS) -> dict:
         """
         Imports devices from a CSV file.
         Dynamically stores extra columns in 'extra_specs'.
+        Hostnames already in the inventory are rejected, never updated
+        (use sync_from_csv for that).
+
+        The file is read in chunks of `chunk_size` rows; each chunk is validated
+        with pandas column operations, checked against the inventory with
+        batched IN lookups and inserted with one executemany, in its own transaction.
+        Rows are never partially imported: a bad row is rejected and reported,
+        the rest of the chunk still goes in.
+
+        Returns {"rows": total data rows, "inserted": n,
+                 "rejected": [{"row": CSV line, "hostname": ..., "reason": ...}]}.
         """
-        import pandas as pd
-        import json
-        
+        report = {"rows": 0, "inserted": 0, "rejected": []}
         try:
-            df = pd.read_csv(csv_path)
-            # Normalize column names to lowercase/stripped
-            df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
-            
-            # Known fields map
-            # Known fields map
-            known_fields = ['hostname', 'ip_address', 'model', 'serial_number', 'location', 'device_type', 'os_family', 'auth_method', 'ssh_user', 'ssh_port']
-            
-            count = 0
-            with Session(self.engine) as session:
-                for _, row in df.iterrows():
-                    hostname = row.get('hostname')
-                    if not hostname or pd.isna(hostname):
-                        continue 
-                        
-                    # Check existing
-                    if session.scalars(select(Device).where(Device.hostname == hostname)).first():
-                        continue
-                    
-                    # Collect extra specs
-                    extra_data = {}
-                    for col in df.columns:
-                        if col not in known_fields and not pd.isna(row.get(col)):
-                            extra_data[col] = str(row.get(col))
-                            
-                    new_device = Device(
-                        hostname=hostname,
-                        ip_address=row.get('ip_address') if not pd.isna(row.get('ip_address')) else None,
-                        model=row.get('model'),
-                        serial_number=str(row.get('serial_number')),
-                        location=row.get('location'),
-                        device_type=row.get('device_type', 'Server'),
-                        os_family=row.get('os_family', 'linux'),
-                        auth_method=row.get('auth_method', 'ssh_key'),
-                        ssh_user=row.get('ssh_user'),
-                        ssh_port=int(row.get('ssh_port', 22)) if not pd.isna(row.get('ssh_port')) else 22,
-                        extra_specs=json.dumps(extra_data) if extra_data else None
-                    )
-                    session.add(new_device)
-                    count += 1
-                
-                session.commit()
-            return count
+            for chunk in _iter_csv_chunks(csv_path, chunk_size):
+                df, reason = chunk["df"], chunk["reason"]
+                report["rows"] += len(df)
+
+                with self.engine.begin() as conn:
+                    # Set-based lookups for the whole chunk, 500 values per IN list
+                    hostnames = df["hostname"].dropna().unique().tolist()
+                    serials = df["serial_number"].dropna().unique().tolist()
+                    existing_hostnames = set()
+                    for i in range(0, len(hostnames), 500):
+                        existing_hostnames.update(conn.execute(
+                            select(Device.hostname).where(Device.hostname.in_(hostnames[i:i + 500]))
+                        ).scalars())
+                    existing_serials = set()
+                    for i in range(0, len(serials), 500):
+                        existing_serials.update(conn.execute(
+                            select(Device.serial_number).where(Device.serial_number.in_(serials[i:i + 500]))
+                        ).scalars())
+                    reason = _reject(reason, df["hostname"].isin(existing_hostnames), "hostname already in inventory")
+                    reason = _reject(reason, df["serial_number"].isin(existing_serials), "serial_number already in inventory")
+
+                    records = _chunk_records(chunk, reason.isna())
+                    if records:
+                        inserted = conn.execute(insert(Device).returning(Device.id, Device.extra_specs), records)
+                        _write_specs(conn, inserted.all())
+                    report["inserted"] += len(records)
+
+                report["rejected"].extend(_rejections(df, reason))
+                if records:
+                    self.device_index.invalidate()
+            return report
         except Exception as e:
             print(f"Error importing CSV: {e}")
             raise e
+
+    def sync_from_csv(self,
+                      csv_path: str,
+                      dry_run: bool = True,
+                      remove_missing: bool = True,
+                      chunk_size: int = IMPORT_CHUNK_ROWS) -> dict:
+        """
+        Brings the inventory in line with a full CSV export (e.g. nightly CMDB dump).
+
+        Every device stores a fingerprint of its imported fields; rows whose
+        fingerprint did not change are not touched. Devices missing from the
+        CSV are removed (with their components) if `remove_missing`.
+        With `dry_run` (the default) nothing is written and the returned
+        summary shows what would change; otherwise all deltas are applied in
+        one transaction.
+
+        Returns {"rows", "inserted": [hostnames], "updated": [hostnames],
+                 "unchanged": n, "removed": [hostnames], "rejected": [...], "dry_run"}.
+        """
+        incoming = {}
+        lines = {}
+        rejected = []
+        rows = 0
+        for chunk in _iter_csv_chunks(csv_path, chunk_size):
+            rows += len(chunk["df"])
+            valid = chunk["reason"].isna()
+            for record, line in zip(_chunk_records(chunk, valid), _csv_lines(chunk["df"], valid)):
+                incoming[record["hostname"]] = record
+                lines[record["hostname"]] = line
+            rejected.extend(_rejections(chunk["df"], chunk["reason"]))
+        # A row rejected for bad data must not delete the device it describes
+        rejected_hostnames = {r["hostname"] for r in rejected}
+
+        with self.engine.begin() as conn:
+            existing = {
+                row.hostname: row
+                for row in conn.execute(select(Device.id, Device.fingerprint, *FINGERPRINT_COLUMNS))
+            }
+            serial_owner = {row.serial_number: hostname for hostname, row in existing.items()}
+
+            removed = []
+            if remove_missing:
+                removed = [h for h in existing if h not in incoming and h not in rejected_hostnames]
+            removed_set = set(removed)
+
+            inserts, updates, unchanged = [], [], 0
+            for hostname, record in incoming.items():
+                owner = serial_owner.get(record["serial_number"])
+                if owner is not None and owner != hostname and owner not in removed_set:
+                    rejected.append({"row": lines[hostname], "hostname": hostname,
+                                     "reason": f"serial_number already used by {owner}"})
+                    continue
+                current = existing.get(hostname)
+                if current is None:
+                    inserts.append(record)
+                elif (current.fingerprint or device_fingerprint(current._mapping)) == record["fingerprint"]:
+                    unchanged += 1
+                else:
+                    updates.append({**record, "b_id": current.id})
+
+            if not dry_run:
+                if removed:
+                    ids = [existing[h].id for h in removed]
+                    for i in range(0, len(ids), 500):
+                        part = ids[i:i + 500]
+                        conn.execute(delete(DeviceSpec).where(DeviceSpec.device_id.in_(part)))
+                        conn.execute(delete(Component).where(Component.device_id.in_(part)))
+                        conn.execute(delete(Device).where(Device.id.in_(part)))
+                if updates:
+                    table = Device.__table__
+                    conn.execute(
+                        update(table).where(table.c.id == bindparam("b_id")),
+                        updates,
+                    )
+                    _write_specs(conn, [(r["b_id"], r["extra_specs"]) for r in updates], replace=True)
+                if inserts:
+                    inserted = conn.execute(insert(Device).returning(Device.id, Device.extra_specs), inserts)
+                    _write_specs(conn, inserted.all())
+        if not dry_run:
+            self.device_index.invalidate()
+
+        return {
+            "rows": rows,
+            "inserted": [r["hostname"] for r in inserts],
+            "updated": [r["hostname"] for r in updates],
+            "unchanged": unchanged,
+            "removed": removed,
+            "rejected": sorted(rejected, key=lambda r: r["row"]),
+            "dry_run": dry_run,
+        }
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from sqlalchemy import String, Integer, ForeignKey
+from sqlalchemy import String, Integer, Float, ForeignKey, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -17,6 +17,8 @@ class Device(Base):
     ip_address: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
     # Stores flexible JSON data for extra columns (CPU, RAM, Role, etc.)
     extra_specs: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # sha256 of the imported fields, used by InventoryRepository.sync_from_csv
+    fingerprint: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
     # Connection Details
     os_family: Mapped[str] = mapped_column(String(50), default='linux') # linux, windows, network_ios
@@ -45,3 +47,24 @@ class Component(Base):
 
     def __repr__(self) -> str:
         return f"<Component(type='{self.component_type}', specs='{self.specs}')>"
+
+class DeviceSpec(Base):
+    """
+    One extra_specs attribute of a device, normalized for indexed queries
+    (kept in sync with Device.extra_specs by InventoryRepository).
+    """
+    __tablename__ = "device_specs"
+
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id"), primary_key=True)
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)  # e.g., 'ram', 'nvme_disc'
+    value: Mapped[str] = mapped_column(String(collation="NOCASE"))  # raw text, e.g. '8x 32GB'
+    # Numeric value of `value` (sizes in GB, 'NxM' multiplied), NULL if none
+    num: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_device_specs_key_num", "key", "num"),
+        Index("ix_device_specs_key_value", "key", "value"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<DeviceSpec(device_id={self.device_id}, key='{self.key}', value='{self.value}')>"
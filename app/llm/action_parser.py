@@ -0,0 +1,122 @@
+import re
+import json
+from typing import Optional
+
+OPEN_FENCE = "```json"
+CLOSE_FENCE = "```"
+
+
+def extract_json_action(text: str):
+    """
+    Attempts to extract a JSON block from the text.
+    Looking for ```json ... ``` or just { ... } at the end.
+    """
+    # Regex for json block code
+    json_block = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if json_block:
+        try:
+            return json.loads(json_block.group(1))
+        except:
+            pass
+
+    # Fallback: find last curly brace pair
+    try:
+        # Simplistic heuristic: find first { and last }
+        # logic: start searching from the end to find the last valid JSON object
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            potential_json = text[start:end+1]
+            # Verify if it's valid json
+            return json.loads(potential_json)
+    except:
+        pass
+
+    return None
+
+
+def _partial_fence(text: str, fence: str) -> int:
+    """Length of the longest suffix of `text` that could be the start of `fence`."""
+    for size in range(min(len(fence) - 1, len(text)), 0, -1):
+        if text.endswith(fence[:size]):
+            return size
+    return 0
+
+
+def _parse_action(body: str) -> Optional[dict]:
+    try:
+        data = json.loads(body.strip())
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class ActionStreamParser:
+    """
+    Splits a streamed LLM answer into display text and the proposed action.
+
+    feed() returns the text that is safe to show right away. ```json blocks
+    are held back; when a block closes and contains a JSON object, it is
+    stored in `action` (first one wins) and never shown. Blocks that are not
+    valid JSON are shown unchanged. A possible start of a fence at the end of
+    a chunk is held until the next chunk decides it.
+    """
+
+    def __init__(self):
+        self.action: Optional[dict] = None
+        self.text = ""
+        self._pending = ""
+        self._in_block = False
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk
+        self._pending += chunk
+        visible = []
+        while True:
+            if self._in_block:
+                end = self._pending.find(CLOSE_FENCE)
+                if end == -1:
+                    break
+                body = self._pending[:end]
+                self._pending = self._pending[end + len(CLOSE_FENCE):]
+                self._in_block = False
+                visible.append(self._close_block(body))
+            else:
+                start = self._pending.find(OPEN_FENCE)
+                if start == -1:
+                    keep = _partial_fence(self._pending, OPEN_FENCE)
+                    visible.append(self._pending[:len(self._pending) - keep])
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                visible.append(self._pending[:start])
+                self._pending = self._pending[start + len(OPEN_FENCE):]
+                self._in_block = True
+        return "".join(visible)
+
+    def finish(self) -> str:
+        """
+        Flushes what is left at the end of the stream. An unclosed block is
+        still accepted as an action if it parses; if nothing was found in a
+        block, falls back to extract_json_action over the whole answer.
+        """
+        rest = self._pending
+        self._pending = ""
+        if self._in_block:
+            self._in_block = False
+            action = _parse_action(rest)
+            if action is None:
+                rest = OPEN_FENCE + rest
+            else:
+                self.action = self.action or action
+                rest = ""
+        if self.action is None:
+            self.action = extract_json_action(self.text)
+        return rest
+
+    def _close_block(self, body: str) -> str:
+        action = _parse_action(body)
+        if action is None:
+            return OPEN_FENCE + body + CLOSE_FENCE
+        if self.action is None:
+            self.action = action
+        return ""
@@ -0,0 +1,119 @@
+import os
+import re
+from typing import Optional
+
+_WORD_RE = re.compile(r"\w+")
+
+# Overlapping chunk boundaries shorter than this are left alone
+MIN_OVERLAP_CHARS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for Latin-script text,
+    which is close for Gemini on English/Croatian prose and CLI output).
+    """
+    return (len(text) + 3) // 4
+
+
+def _shingles(text: str, size: int = 3) -> frozenset:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset(words)
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlap(left: str, right: str, max_chars: int) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    tail = left[-max_chars:]
+    for size in range(min(len(tail), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if tail.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextAssembler:
+    """
+    Turns retrieved chunks (best first) into the RAG context for the prompt.
+
+    1. Drops near-duplicates (word 3-gram Jaccard >= `dedup_threshold`).
+    2. Orders the rest with MMR: relevance (retrieval rank) against lexical
+       similarity to chunks already picked, weighted by `mmr_lambda`.
+    3. Cuts text that repeats across a chunk boundary (splitter overlap).
+    4. Packs chunks until `token_budget` estimated tokens are used.
+    """
+
+    def __init__(self,
+                 token_budget: Optional[int] = None,
+                 candidates: Optional[int] = None,
+                 mmr_lambda: float = 0.7,
+                 dedup_threshold: float = 0.8,
+                 max_overlap_chars: int = 400):
+        self.token_budget = token_budget or int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+        # How many chunks callers should retrieve for assemble()
+        self.candidates = candidates or int(os.getenv("RAG_CONTEXT_CANDIDATES", "12"))
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.max_overlap_chars = max_overlap_chars
+
+    def _mmr_order(self, chunks: list[str], shingles: list[frozenset]) -> list[int]:
+        relevance = [1.0 / (rank + 1) for rank in range(len(chunks))]
+        remaining = list(range(len(chunks)))
+        order = []
+        while remaining:
+            best = max(
+                remaining,
+                key=lambda i: self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * max(
+                    (_jaccard(shingles[i], shingles[j]) for j in order), default=0.0
+                ),
+            )
+            order.append(best)
+            remaining.remove(best)
+        return order
+
+    def assemble(self, chunks: list[str]) -> list[str]:
+        """Returns the chunks to put into the prompt, in prompt order."""
+        kept = []
+        kept_shingles = []
+        for chunk in chunks:
+            chunk = chunk.strip()
+            if not chunk:
+                continue
+            sh = _shingles(chunk)
+            if any(_jaccard(sh, other) >= self.dedup_threshold for other in kept_shingles):
+                continue
+            kept.append(chunk)
+            kept_shingles.append(sh)
+
+        packed = []
+        used = 0
+        for index in self._mmr_order(kept, kept_shingles):
+            text = kept[index]
+            for previous in packed:
+                cut = _overlap(previous, text, self.max_overlap_chars)
+                if cut:
+                    text = text[cut:].lstrip()
+                cut = _overlap(text, previous, self.max_overlap_chars)
+                if cut:
+                    text = text[:-cut].rstrip()
+            if not text:
+                continue
+            cost = estimate_tokens(text)
+            if used + cost > self.token_budget:
+                if not packed:
+                    # Never return nothing: trim the best chunk to the budget
+                    packed.append(text[:self.token_budget * 4])
+                    used = self.token_budget
+                continue
+            packed.append(text)
+            used += cost
+        return packed
+
+    def build(self, chunks: list[str]) -> str:
+        return "\n\n".join(self.assemble(chunks))
@@ -0,0 +1,199 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+CACHE_FILE = "embedding_cache.sqlite"
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic local embeddings (hashed bag of words).
+    No network and no model: meant for offline runs, tests and the
+    air-gapped jump box. Similar texts get similar vectors, but retrieval
+    quality is far below a real embedding model.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class EmbeddingCache:
+    """
+    On-disk vector cache keyed by (model, sha256(text)), stored in SQLite.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._conn.commit()
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                part = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    (model, *part),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, items: dict[str, list[float]]):
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, h, array("f", v).tobytes()) for h, v in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain `Embeddings` with batching and a persistent cache.
+
+    Texts already in the cache (for the same model) are never sent to the
+    backend again; the rest are deduplicated and embedded in batches of
+    `batch_size`, up to `max_concurrency` batches at a time.
+    Query and document vectors are cached separately because some backends
+    (e.g. Gemini) embed them differently.
+    """
+
+    def __init__(self,
+                 inner: Embeddings,
+                 model_name: str,
+                 cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = 64,
+                 max_concurrency: int = 4):
+        self.inner = inner
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        model_key = f"{self.model_name}:document"
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(model_key, list(set(hashes))) if self.cache else {}
+
+        # One backend call per distinct missing text
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectors:
+                missing.setdefault(h, t)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            pending = list(missing.items())
+            batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+
+            def _embed_batch(batch):
+                return dict(zip((h for h, _ in batch), self.inner.embed_documents([t for _, t in batch])))
+
+            new_vectors = {}
+            if len(batches) == 1 or self.max_concurrency == 1:
+                for batch in batches:
+                    new_vectors.update(_embed_batch(batch))
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                    for result in pool.map(_embed_batch, batches):
+                        new_vectors.update(result)
+
+            if self.cache:
+                self.cache.put_many(model_key, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        model_key = f"{self.model_name}:query"
+        h = text_hash(text)
+        if self.cache:
+            cached = self.cache.get_many(model_key, [h])
+            if h in cached:
+                self.hits += 1
+                return cached[h]
+        self.misses += 1
+        vector = self.inner.embed_query(text)
+        if self.cache:
+            self.cache.put_many(model_key, {h: vector})
+        return vector
+
+
+def build_embeddings(persist_directory: str,
+                     inner: Optional[Embeddings] = None,
+                     model_name: Optional[str] = None) -> CachedEmbeddings:
+    """
+    Creates the cached embedder used by RagEngine.
+    Backend is `inner` if given, otherwise EMBEDDINGS_PROVIDER from .env:
+    "google" (default, Gemini embedding-001) or "hash" (offline HashEmbeddings).
+    """
+    if inner is None:
+        provider = os.getenv("EMBEDDINGS_PROVIDER", "google").lower()
+        if provider in ("hash", "fake", "local"):
+            inner = HashEmbeddings()
+            model_name = "hash-256"
+        else:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                print("WARNING: GOOGLE_API_KEY not found. Embeddings will fail.")
+            model_name = "models/embedding-001"
+            inner = GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=api_key)
+
+    return CachedEmbeddings(
+        inner,
+        model_name=model_name or type(inner).__name__,
+        cache=EmbeddingCache(os.path.join(persist_directory, CACHE_FILE)),
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+        max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+    )
@@ -1,25 +1,61 @@
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.vectorstores import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from llama_parse import LlamaParse
 from dotenv import load_dotenv
+from typing import Optional
+
+from app.rag.cache import TTLCache, normalize_query
+from app.rag.embeddings import build_embeddings
+from app.rag.lexical import LEXICAL_FILE, BM25Index, reciprocal_rank_fusion
+from app.rag.manifest import LEGACY_MANIFEST_FILE, MANIFEST_FILE, IngestManifest
+from app.rag.pdf import PDF_BACKENDS, iter_pdf_pages
+from app.rag.tagging import TAG_FIELDS, detect_tags
 
 load_dotenv()
 
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+FILTER_FIELDS = ("source",) + TAG_FIELDS
+
+_inventory_repo = None
+
+def inventory_models() -> list[str]:
+    """Device.model values from the inventory, or [] if it is not available."""
+    global _inventory_repo
+    try:
+        if _inventory_repo is None:
+            from app.data.inventory_repo import InventoryRepository
+            _inventory_repo = InventoryRepository()
+        return _inventory_repo.get_models()
+    except Exception as e:
+        print(f"WARNING: Inventory models not available for tagging ({type(e).__name__}).")
+        return []
+
+def file_sha256(path: str) -> str:
+    """Hash of the raw file, used to skip unchanged files before parsing."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source: str, text: str) -> str:
+    """Deterministic vector id: same source + same chunk text -> same id."""
+    return hashlib.sha256(f"{source}\n{text}".encode("utf-8")).hexdigest()
+
 class RagEngine:
-    def __init__(self, persist_directory: str = "./app/data/chroma_db"):
+    def __init__(self, persist_directory: str = "./app/data/chroma_db", embeddings: Optional[Embeddings] = None):
         self.persist_directory = persist_directory
         
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-             print("WARNING: GOOGLE_API_KEY not found. Embeddings will fail.")
-
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=api_key
-        )
+        # Batched, disk-cached embedder; `embeddings` overrides the backend
+        # chosen by EMBEDDINGS_PROVIDER (google | hash)
+        self.embeddings = build_embeddings(self.persist_directory, inner=embeddings)
         
         # Initialize ChromaDB
         self.vector_store = Chroma(
@@ -27,61 +63,248 @@ class RagEngine:
             embedding_function=self.embeddings
         )
 
-    def ingest_document(self, pdf_path: str) -> int:
+        # Per-source manifest: file hash + chunk ids currently in the index.
+        # Shared on disk with other processes ingesting into the same directory.
+        self.manifest = IngestManifest(
+            os.path.join(self.persist_directory, MANIFEST_FILE),
+            legacy_path=os.path.join(self.persist_directory, LEGACY_MANIFEST_FILE),
+        )
+        # Several files may be ingested concurrently (scripts/ingest.py --all)
+        self._version_lock = threading.Lock()
+
+        # BM25 index over the same chunks, for exact tokens (model numbers,
+        # CLI verbs, VLAN IDs) that embeddings tend to miss
+        self.lexical = BM25Index(os.path.join(self.persist_directory, LEXICAL_FILE))
+        self._backfill_lexical_index()
+        self._backfill_tags()
+        self.search_mode = os.getenv("RAG_SEARCH_MODE", "hybrid").lower()
+        if self.search_mode not in SEARCH_MODES:
+            print(f"WARNING: Unknown RAG_SEARCH_MODE '{self.search_mode}', using hybrid.")
+            self.search_mode = "hybrid"
+
+        # In-memory query caches. Result keys include `index_version`, which
+        # _sync_chunks bumps whenever the collection changes, and which every
+        # query bumps as well when the index was written by another process
+        # (see _check_disk_version), so a re-ingest never serves stale chunks.
+        cache_size = int(os.getenv("RAG_CACHE_SIZE", "256"))
+        cache_ttl = float(os.getenv("RAG_CACHE_TTL", "600"))
+        self.index_version = 0
+        # (index_version, tags) for indexed_tags()
+        self._indexed_tags = (-1, {})
+        self._query_vectors = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._query_results = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._disk_version = self.lexical.data_version()
+
+        # Bounded pool for aquery: embedding + vector search are blocking calls
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_QUERY_WORKERS", "8")),
+            thread_name_prefix="rag-query",
+        )
+
+    def _backfill_lexical_index(self, batch_size: int = 1000):
+        """
+        Builds the lexical index from Chroma for collections ingested before it
+        existed (with or without an ingest manifest).
+        """
+        total = self.vector_store._collection.count()
+        if len(self.lexical) or not total:
+            return
+        for offset in range(0, total, batch_size):
+            data = self.vector_store.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            self.lexical.add(
+                (cid, {"source": "", **(metadata or {})}, text)
+                for cid, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+            )
+        print(f"Built lexical index for {total} existing chunks.")
+
+    def _backfill_tags(self):
+        """
+        Tags chunks ingested before chunks carried vendor/model/doc_type
+        (no re-parse, no re-embed). Untagged sources are found from the chunk
+        metadata, so collections without an ingest manifest are covered too.
+        """
+        untagged = self.lexical.untagged_sources()
+        if not untagged:
+            return
+        known_models = inventory_models()
+        for source in untagged:
+            tags = detect_tags(source, "\n".join(self.lexical.texts(source)), known_models)
+            ids = self.vector_store.get(where={"source": source}, include=[])["ids"]
+            self._retag(ids, tags)
+            self.manifest.set_tags(source, tags)
+        print(f"Tagged {len(untagged)} previously ingested sources.")
+
+    def _retag(self, ids: list[str], tags: dict):
+        """Sets vendor/model/doc_type on chunks that are already indexed."""
+        if not ids:
+            return
+        existing = self.vector_store.get(ids=ids, include=["metadatas"])
+        metadatas = []
+        for metadata in existing["metadatas"]:
+            metadata = {k: v for k, v in (metadata or {}).items() if k not in TAG_FIELDS}
+            metadata.update(tags)
+            metadatas.append(metadata)
+        if existing["ids"]:
+            self.vector_store._collection.update(ids=existing["ids"], metadatas=metadatas)
+        self.lexical.set_tags(ids, tags)
+
+    def indexed_tags(self) -> dict:
+        """{field: set of values} over all indexed chunks, e.g. {"vendor": {"cisco", "hpe"}}."""
+        version, tags = self._indexed_tags
+        if version != self.index_version:
+            tags = self.lexical.tag_values()
+            self._indexed_tags = (self.index_version, tags)
+        return tags
+
+    def is_unchanged(self, source: str, file_hash: str) -> bool:
+        entry = self.manifest.get(source)
+        return bool(entry) and entry.get("file_hash") == file_hash
+
+    def _sync_chunks(self, source: str, file_hash: str, chunks: list[Document]) -> int:
         """
-        Ingests a PDF document into the vector store using LlamaParse.
+        Brings the index for `source` in line with `chunks`:
+        embeds only chunks whose id is not indexed yet and deletes stale ones.
+        Returns the number of newly embedded chunks.
+        """
+        ids = []
+        seen = set()
+        unique_chunks = []
+        for chunk in chunks:
+            cid = chunk_id(source, chunk.page_content)
+            if cid in seen:
+                continue  # identical text repeated in the same document
+            seen.add(cid)
+            chunk.metadata["source"] = source
+            ids.append(cid)
+            unique_chunks.append(chunk)
+
+        # Document-level tags, from the file name and the first chunks
+        tags = detect_tags(source, "\n".join(c.page_content for c in unique_chunks[:20]), inventory_models())
+        for chunk in unique_chunks:
+            chunk.metadata.update(tags)
+
+        entry = self.manifest.get(source)
+        if entry is not None:
+            previous = set(entry.get("chunk_ids", []))
+        else:
+            # First incremental ingest of this source: anything already indexed
+            # under it (e.g. random ids from older versions) is treated as stale.
+            previous = set(self.vector_store.get(where={"source": source}).get("ids", []))
+
+        current = set(ids)
+        stale = previous - current
+        new_pairs = [(cid, chunk) for cid, chunk in zip(ids, unique_chunks) if cid not in previous]
+
+        if stale:
+            self.vector_store.delete(ids=list(stale))
+            self.lexical.delete(stale)
+        if new_pairs:
+            self.vector_store.add_documents([c for _, c in new_pairs], ids=[cid for cid, _ in new_pairs])
+            self.lexical.add((cid, c.metadata, c.page_content) for cid, c in new_pairs)
+        retag = entry is not None and entry.get("tags") != tags
+        if retag:
+            # e.g. a new inventory model now matches this document
+            self._retag([cid for cid in ids if cid in previous], tags)
+        if stale or new_pairs or retag:
+            self.vector_store.persist()
+            self._invalidate_query_cache()
+
+        self.manifest.set(source, file_hash, ids, tags)
+        print(f"{source}: {len(new_pairs)} new, {len(stale)} removed, {len(ids) - len(new_pairs)} unchanged chunks")
+        return len(new_pairs)
+
+    def ingest_document(self, pdf_path: str, backend: Optional[str] = None) -> int:
+        """
+        Ingests a PDF document into the vector store.
+        `backend` is "llamaparse" (cloud, best for tables) or "pypdf" (local,
+        parallel, works offline); defaults to PDF_BACKEND from .env.
+        Unchanged files are skipped; otherwise only new chunks are embedded
+        and chunks that disappeared from the file are deleted.
         Returns the number of chunks added.
         """
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"File not found: {pdf_path}")
 
-        print(f"Starting parsing of {pdf_path} with LlamaParse...")
-        
-        try:
-            # LlamaParse extraction (markdown mode is excellent for tables)
-            parser = LlamaParse(
-                result_type="markdown",
-                verbose=True,
-                language="en"
-            )
-            json_objs = parser.load_data(pdf_path)
-            
-            # Convert LlamaIndex documents to LangChain Documents
-            documents = []
-            for obj in json_objs:
-                # obj is usually a LlamaIndex Document object, we need its text
-                text = obj.text
-                metadata = obj.metadata or {}
-                metadata["source"] = pdf_path
-                documents.append(Document(page_content=text, metadata=metadata))
-                
-            # Chunking
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=2000,
-                chunk_overlap=200
-            )
-            chunks = text_splitter.split_documents(documents)
-            
-            # Add to Vector Store
-            if chunks:
-                self.vector_store.add_documents(chunks)
-                self.vector_store.persist()
-                print(f"Successfully ingested {len(chunks)} chunks from {pdf_path}")
-                return len(chunks)
+        backend = (backend or os.getenv("PDF_BACKEND", "llamaparse")).lower()
+        if backend not in PDF_BACKENDS:
+            raise ValueError(f"Unknown PDF backend '{backend}', expected one of {PDF_BACKENDS}")
+
+        file_hash = file_sha256(pdf_path)
+        if self.is_unchanged(pdf_path, file_hash):
+            print(f"{pdf_path} is unchanged since last ingest, skipping.")
             return 0
+
+        try:
+            if backend == "pypdf":
+                chunks = self._chunk_pdf_local(pdf_path)
+            else:
+                chunks = self._chunk_pdf_llamaparse(pdf_path)
+
+            # Add only new/changed chunks to the Vector Store
+            return self._sync_chunks(pdf_path, file_hash, chunks)
             
         except Exception as e:
             print(f"Error during ingestion: {e}")
             raise e
 
+    def _chunk_pdf_llamaparse(self, pdf_path: str) -> list[Document]:
+        print(f"Starting parsing of {pdf_path} with LlamaParse...")
+        
+        # LlamaParse extraction (markdown mode is excellent for tables)
+        parser = LlamaParse(
+            result_type="markdown",
+            verbose=True,
+            language="en"
+        )
+        json_objs = parser.load_data(pdf_path)
+        
+        # Convert LlamaIndex documents to LangChain Documents
+        documents = []
+        for obj in json_objs:
+            # obj is usually a LlamaIndex Document object, we need its text
+            text = obj.text
+            metadata = obj.metadata or {}
+            metadata["source"] = pdf_path
+            documents.append(Document(page_content=text, metadata=metadata))
+            
+        # Chunking
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=2000,
+            chunk_overlap=200
+        )
+        return text_splitter.split_documents(documents)
+
+    def _chunk_pdf_local(self, pdf_path: str) -> list[Document]:
+        print(f"Starting parsing of {pdf_path} with pypdf...")
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=2000,
+            chunk_overlap=200
+        )
+        workers = os.getenv("PDF_WORKERS")
+        chunks = []
+        # Pages are chunked as they come out of the process pool; each chunk
+        # keeps the page it came from
+        for page_number, text in iter_pdf_pages(pdf_path, max_workers=int(workers) if workers else None):
+            if not text.strip():
+                continue
+            page = Document(page_content=text, metadata={"source": pdf_path, "page": page_number})
+            chunks.extend(text_splitter.split_documents([page]))
+        return chunks
+
     def ingest_markdown(self, file_path: str) -> int:
         """
         Ingests a Markdown file into the vector store.
         Simple text reading, no external parser needed for basic MD.
+        Incremental like ingest_document. Returns the number of chunks added.
         """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
+        file_hash = file_sha256(file_path)
+        if self.is_unchanged(file_path, file_hash):
+            print(f"{file_path} is unchanged since last ingest, skipping.")
+            return 0
+
         print(f"Reading markdown file: {file_path}...")
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -89,7 +312,8 @@ class RagEngine:
 
             if not content:
                 print("File is empty.")
-                return 0
+                # Drops whatever an earlier version of the file left in the index
+                return self._sync_chunks(file_path, file_hash, [])
 
             # Create a single document (we rely on splitter to chunk it)
             metadata = {"source": file_path, "type": "markdown"}
@@ -102,22 +326,129 @@ class RagEngine:
             )
             chunks = text_splitter.split_documents([doc])
             
-            # Add to Vector Store
-            if chunks:
-                self.vector_store.add_documents(chunks)
-                self.vector_store.persist()
-                print(f"Successfully ingested {len(chunks)} chunks from {file_path}")
-                return len(chunks)
-            return 0
+            # Add only new/changed chunks to the Vector Store
+            return self._sync_chunks(file_path, file_hash, chunks)
 
         except Exception as e:
             print(f"Error ingesting markdown: {e}")
             raise e
 
-    def query(self, question: str, k: int = 3) -> list[str]:
+    def _invalidate_query_cache(self):
+        with self._version_lock:
+            self.index_version += 1
+        self._query_results.clear()
+
+    def _check_disk_version(self):
+        """
+        Invalidates the result cache when the lexical index file was written
+        since the last query. Ingests write Chroma and the lexical index
+        together, so this also catches scripts/ingest.py running next to the app.
+        """
+        version = self.lexical.data_version()
+        if version != self._disk_version:
+            self._disk_version = version
+            self._invalidate_query_cache()
+
+    def _embed_query(self, question: str, key: str) -> list[float]:
+        vector = self._query_vectors.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(question)
+            self._query_vectors.set(key, vector)
+        return vector
+
+    def _vector_search(self, question: str, key: str, k: int, filters: Optional[dict]) -> list[str]:
+        vector = self._embed_query(question, key)
+        if filters and len(filters) > 1:
+            where = {"$and": [{field: value} for field, value in filters.items()]}
+        else:
+            where = filters or None
+        return [doc.page_content for doc in self.vector_store.similarity_search_by_vector(vector, k=k, filter=where)]
+
+    def _lexical_search(self, question: str, k: int, filters: Optional[dict]) -> list[str]:
+        return [text for _, text, _ in self.lexical.search(question, k=k, filters=filters)]
+
+    def _search(self, question: str, key: str, result_key: tuple, k: int, mode: str, filters: Optional[dict]) -> list[str]:
+        if mode == "lexical":
+            chunks = self._lexical_search(question, k, filters)
+        elif mode == "vector":
+            chunks = self._vector_search(question, key, k, filters)
+        else:
+            # Reciprocal rank fusion over a deeper candidate list from both sides
+            depth = max(k * 4, 10)
+            fused = reciprocal_rank_fusion([
+                self._vector_search(question, key, depth, filters),
+                self._lexical_search(question, depth, filters),
+            ])
+            chunks = fused[:k]
+        self._query_results.set(result_key, tuple(chunks))
+        return chunks
+
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = (mode or self.search_mode).lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+        return mode
+
+    def _result_key(self, key: str, k: int, mode: str, filters: Optional[dict]) -> tuple:
+        for field in filters or {}:
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Unknown filter '{field}', expected one of {FILTER_FIELDS}")
+        return (key, k, mode, tuple(sorted((filters or {}).items())), self.index_version)
+
+    def query(self, question: str, k: int = 3, mode: Optional[str] = None, filters: Optional[dict] = None) -> list[str]:
         """
         Retrieves relevant document chunks for the question.
         Returns a list of strings (content of the chunks).
+        `mode` is "hybrid" (vector + BM25, fused), "vector" or "lexical"
+        (BM25 only, no embedding call); defaults to RAG_SEARCH_MODE.
+        `filters` limits the search to chunks with matching metadata,
+        e.g. {"vendor": "huawei"} or {"model": "s5735", "doc_type": "configuration"}.
+        Repeated questions (ignoring case and whitespace) are served from memory
+        until the TTL expires or the index changes.
+        """
+        mode = self._resolve_mode(mode)
+        self._check_disk_version()
+        key = normalize_query(question)
+        result_key = self._result_key(key, k, mode, filters)
+        cached = self._query_results.get(result_key)
+        if cached is not None:
+            return list(cached)
+        return self._search(question, key, result_key, k, mode, filters)
+
+    async def aquery(self, question: str, k: int = 3, mode: Optional[str] = None, filters: Optional[dict] = None) -> list[str]:
+        """
+        Async variant of query() for the chat handler. Cache hits are answered
+        on the event loop; misses run on the engine's bounded thread pool
+        (RAG_QUERY_WORKERS) so a slow embedding call never blocks other users.
         """
-        results = self.vector_store.similarity_search(question, k=k)
-        return [doc.page_content for doc in results]
+        mode = self._resolve_mode(mode)
+        self._check_disk_version()
+        key = normalize_query(question)
+        result_key = self._result_key(key, k, mode, filters)
+        cached = self._query_results.get(result_key)
+        if cached is not None:
+            return list(cached)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._search, question, key, result_key, k, mode, filters)
+
+    async def aembed_query(self, question: str, mode: Optional[str] = None):
+        """
+        Embeds the question on the query pool without searching, so the
+        caller can overlap the embedding call with other work; the aquery()
+        calls that follow (any k or filters) reuse the cached vector.
+        No-op in lexical mode.
+        """
+        if self._resolve_mode(mode) == "lexical":
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._embed_query, question, normalize_query(question))
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the query caches and the embedding cache."""
+        return {
+            "index_version": self.index_version,
+            "lexical_chunks": len(self.lexical),
+            "query_vectors": self._query_vectors.stats(),
+            "query_results": self._query_results.stats(),
+            "embeddings": {"hits": self.embeddings.hits, "misses": self.embeddings.misses},
+        }
@@ -0,0 +1,239 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable, Optional
+
+LEXICAL_FILE = "lexical_index.sqlite"
+
+# Chunk metadata stored next to the text, usable as search filters
+FILTER_COLUMNS = ("source", "vendor", "model", "doc_type")
+
+# Keeps model numbers (S5735-L24T4X), interface names (gi0/1), versions (16.9.4)
+# and IPs together; their parts are indexed as separate terms as well.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """
+    Persistent inverted index (SQLite) over the same chunks as the Chroma
+    collection, scored with Okapi BM25.
+
+    Chunk text is stored too, so a lexical search needs neither Chroma nor
+    an embedding call. Safe to use from several threads.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._stats: Optional[tuple[int, float]] = None
+        # Own connection for PRAGMA data_version: it sees commits from every
+        # other connection (self._conn, or another process such as
+        # scripts/ingest.py) and never waits behind a search holding self._lock
+        self._version_conn = sqlite3.connect(path, check_same_thread=False)
+        self._version_lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, source TEXT NOT NULL, length INTEGER NOT NULL, text TEXT NOT NULL, "
+                "vendor TEXT, model TEXT, doc_type TEXT)"
+            )
+            # Index files created before chunks were tagged
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+            for column in FILTER_COLUMNS:
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {column} TEXT")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+                "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id)")
+            for column in FILTER_COLUMNS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_chunks_{column} ON chunks ({column})")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._collection_stats()[0]
+
+    def add(self, items: Iterable[tuple[str, dict, str]]):
+        """
+        Indexes (chunk_id, metadata, text) triples; existing ids are replaced.
+        `metadata` must contain "source"; vendor/model/doc_type are optional.
+        """
+        chunk_rows = []
+        posting_rows = []
+        for cid, metadata, text in items:
+            terms = Counter(tokenize(text))
+            chunk_rows.append((cid, sum(terms.values()), text, *(metadata.get(c) for c in FILTER_COLUMNS)))
+            posting_rows.extend((term, cid, tf) for term, tf in terms.items())
+        if not chunk_rows:
+            return
+        with self._lock:
+            try:
+                self._delete_locked([row[0] for row in chunk_rows])
+                self._conn.executemany(
+                    f"INSERT INTO chunks (id, length, text, {', '.join(FILTER_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    chunk_rows,
+                )
+                self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._stats = None
+
+    def set_tags(self, ids: Iterable[str], tags: dict):
+        """Updates vendor/model/doc_type of already indexed chunks."""
+        ids = list(ids)
+        columns = [c for c in FILTER_COLUMNS if c != "source"]
+        values = [tags.get(c) for c in columns]
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                self._conn.execute(
+                    f"UPDATE chunks SET {', '.join(f'{c} = ?' for c in columns)} WHERE id IN ({','.join('?' * len(part))})",
+                    values + part,
+                )
+            self._conn.commit()
+
+    def texts(self, source: str, limit: int = 20) -> list[str]:
+        """First chunks of a source (used to re-derive its tags)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT text FROM chunks WHERE source = ? LIMIT ?", (source, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def untagged_sources(self) -> list[str]:
+        """Sources with chunks indexed before chunks were tagged (doc_type is always set by tagging)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT source FROM chunks WHERE doc_type IS NULL").fetchall()
+        return [row[0] for row in rows]
+
+    def tag_values(self) -> dict:
+        """{field: set of values} of vendor/model/doc_type over all indexed chunks."""
+        columns = [c for c in FILTER_COLUMNS if c != "source"]
+        values = {column: set() for column in columns}
+        with self._lock:
+            for column in columns:
+                rows = self._conn.execute(f"SELECT DISTINCT {column} FROM chunks WHERE {column} IS NOT NULL").fetchall()
+                values[column].update(row[0] for row in rows)
+        return values
+
+    def delete(self, ids: Iterable[str]):
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            try:
+                self._delete_locked(ids)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._stats = None
+
+    def _delete_locked(self, ids: list[str]):
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({marks})", part)
+
+    def _collection_stats(self) -> tuple[int, float]:
+        stats = self._stats
+        if stats is None:
+            with self._lock:
+                count, avg_length = self._conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            stats = self._stats = (count, avg_length or 0.0)
+        return stats
+
+    def data_version(self) -> int:
+        """Changes whenever the index file has been written, by any process."""
+        with self._version_lock:
+            version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._data_version:
+                # Chunk count / average length may have been changed elsewhere
+                self._data_version = version
+                self._stats = None
+        return version
+
+    def search(self, query: str, k: int = 3, filters: Optional[dict] = None) -> list[tuple[str, str, float]]:
+        """
+        Returns up to k (chunk_id, text, score) tuples, best first.
+        `filters` ({column: value}, see FILTER_COLUMNS) restricts the chunks searched.
+        """
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        total, avg_length = self._collection_stats()
+        if not total:
+            return []
+
+        where = ""
+        params = []
+        for column, value in (filters or {}).items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Unknown filter '{column}', expected one of {FILTER_COLUMNS}")
+            where += f" AND c.{column} = ?"
+            params.append(value)
+
+        # IDF stays collection-wide so scores are comparable across scopes
+        marks = ",".join("?" * len(terms))
+        with self._lock:
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", list(terms)
+            ).fetchall())
+            rows = self._conn.execute(
+                f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk_id "
+                f"WHERE p.term IN ({marks}){where}", list(terms) + params
+            ).fetchall()
+
+        scores: dict[str, float] = {}
+        for term, cid, tf, length in rows:
+            idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[cid] = scores.get(cid, 0.0) + terms[term] * idf * tf * (self.k1 + 1) / norm
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not best:
+            return []
+        with self._lock:
+            texts = dict(self._conn.execute(
+                f"SELECT id, text FROM chunks WHERE id IN ({','.join('?' * len(best))})", [cid for cid, _ in best]
+            ).fetchall())
+        return [(cid, texts[cid], score) for cid, score in best]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        with self._version_lock:
+            self._version_conn.close()
+
+
+def reciprocal_rank_fusion(rankings: Iterable[list[str]], k: int = 60) -> list[str]:
+    """Fuses several rankings of ids (best first) with RRF: score = sum 1 / (k + rank)."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+MANIFEST_FILE = "ingest_manifest.sqlite"
+# JSON manifest written by earlier versions; imported once
+LEGACY_MANIFEST_FILE = "ingest_manifest.json"
+
+
+class IngestManifest:
+    """
+    Per-source ingest manifest (file hash, chunk ids, tags), stored in SQLite.
+
+    One row per source, so several processes (the running app and
+    scripts/ingest.py) can record ingests into the same persist directory
+    without overwriting each other's entries, and every read sees what the
+    others wrote. Safe to use from several threads.
+    """
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS manifest ("
+                "source TEXT PRIMARY KEY, file_hash TEXT NOT NULL, chunk_ids TEXT NOT NULL, tags TEXT)"
+            )
+            self._conn.commit()
+        if legacy_path and os.path.exists(legacy_path) and not len(self):
+            self._import_legacy(legacy_path)
+
+    def _import_legacy(self, legacy_path: str):
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not read ingest manifest ({e}), rebuilding it.")
+            return
+        with self._lock:
+            # OR IGNORE: another process may be importing the same file right now
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO manifest (source, file_hash, chunk_ids, tags) VALUES (?, ?, ?, ?)",
+                [
+                    (source, entry.get("file_hash", ""), json.dumps(entry.get("chunk_ids", [])),
+                     json.dumps(entry["tags"]) if "tags" in entry else None)
+                    for source, entry in entries.items()
+                ],
+            )
+            self._conn.commit()
+        print(f"Imported {len(entries)} sources from {os.path.basename(legacy_path)}.")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+    def get(self, source: str) -> Optional[dict]:
+        """{"file_hash", "chunk_ids", "tags"?} for `source`, or None if it was never ingested."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_hash, chunk_ids, tags FROM manifest WHERE source = ?", (source,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = {"file_hash": row[0], "chunk_ids": json.loads(row[1])}
+        if row[2] is not None:
+            entry["tags"] = json.loads(row[2])
+        return entry
+
+    def set(self, source: str, file_hash: str, chunk_ids: list[str], tags: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest (source, file_hash, chunk_ids, tags) VALUES (?, ?, ?, ?)",
+                (source, file_hash, json.dumps(chunk_ids), json.dumps(tags)),
+            )
+            self._conn.commit()
+
+    def set_tags(self, source: str, tags: dict):
+        """Updates the tags of an already recorded source (no-op otherwise)."""
+        with self._lock:
+            self._conn.execute("UPDATE manifest SET tags = ? WHERE source = ?", (json.dumps(tags), source))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
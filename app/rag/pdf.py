@@ -0,0 +1,81 @@
+import os
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from pypdf import PdfReader
+
+PDF_BACKENDS = ("llamaparse", "pypdf")
+
+# One process pool shared by every PDF being parsed at the same time
+# (scripts/ingest.py --workers N parses N files at once); closed by the
+# last user so no idle worker processes are left behind
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_users = 0
+_pool_lock = threading.Lock()
+
+
+def _extract_pages(path: str, start: int, end: int) -> list[tuple[int, str]]:
+    """Worker: text of pages [start, end) as (1-based page number, text)."""
+    reader = PdfReader(path)
+    pages = []
+    for index in range(start, end):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            # One broken page should not fail the whole manual
+            print(f"WARNING: Could not extract page {index + 1} of {path}: {e}")
+            text = ""
+        pages.append((index + 1, text))
+    return pages
+
+
+@contextmanager
+def _shared_pool(max_workers: int):
+    global _pool, _pool_users
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: callers run threads (chat via make_async, ingest.py's
+            # thread pool), and forking a multithreaded process can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_users += 1
+        pool = _pool
+    try:
+        yield pool
+    finally:
+        with _pool_lock:
+            _pool_users -= 1
+            last = _pool_users == 0
+            if last:
+                _pool = None
+        if last:
+            pool.shutdown(wait=True)
+
+
+def iter_pdf_pages(path: str,
+                   max_workers: Optional[int] = None,
+                   pages_per_task: int = 16) -> Iterator[tuple[int, str]]:
+    """
+    Yields (page number, text) for every page of the PDF, in order.
+
+    Page ranges are parsed in a process pool (pypdf is pure Python, so threads
+    would not help) and handed out as soon as each range is done, so callers
+    can chunk early pages while later ones are still being parsed.
+    The pool (`max_workers` processes, default cpu_count) is shared with
+    other PDFs parsed concurrently. Small documents are parsed inline.
+    """
+    page_count = len(PdfReader(path).pages)
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    pool_size = max_workers or os.cpu_count() or 1
+
+    if min(pool_size, len(ranges)) <= 1:
+        for start, end in ranges:
+            yield from _extract_pages(path, start, end)
+        return
+
+    with _shared_pool(pool_size) as pool:
+        # map() keeps page order and yields each range as soon as it is ready
+        for pages in pool.map(_extract_pages, *zip(*((path, start, end) for start, end in ranges))):
+            yield from pages
@@ -0,0 +1,31 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from app.rag.context import ContextAssembler, estimate_tokens
+from app.rag.engine import RagEngine
+from app.rag.tagging import scopes_for_question
+
+
+async def retrieve_context(engine: RagEngine,
+                           assembler: ContextAssembler,
+                           question: str,
+                           load_devices: Callable[[], Awaitable[list]]):
+    """
+    Runs RAG scoped to the device/model/vendor the question names (narrowest
+    scope with results wins, whole collection only as the fallback).
+    The inventory lookup (`load_devices`) runs while the question is being
+    embedded; every scope then reuses that embedding.
+    Returns (context chunks packed to the token budget, devices).
+    """
+    devices, _ = await asyncio.gather(load_devices(), engine.aembed_query(question))
+    scopes = scopes_for_question(question, devices, engine.indexed_tags())
+    for scope in scopes + [None]:
+        candidates = await engine.aquery(question, k=assembler.candidates, filters=scope)
+        if candidates:
+            if scope:
+                print(f"[RAG] Scoped retrieval: {scope}")
+            chunks = assembler.assemble(candidates)
+            print(f"[RAG] Context: {len(chunks)}/{len(candidates)} chunks, "
+                  f"~{sum(map(estimate_tokens, chunks))} tokens (budget {assembler.token_budget})")
+            return chunks, devices
+    return [], devices
@@ -0,0 +1,137 @@
+import os
+import re
+from collections import Counter
+from typing import Iterable, Optional
+
+# Metadata fields that can be used as query filters
+TAG_FIELDS = ("vendor", "model", "doc_type")
+
+VENDOR_PATTERNS = {
+    "cisco": r"\bcisco\b|\bisr\s?\d{4}|\bcatalyst\b|\bios-xe\b|\bnx-os\b",
+    "huawei": r"\bhuawei\b|\bs\d{4}-|\bvrp\b",
+    "hpe": r"\bhpe?\b|\bproliant\b|\bilo\s?\d?\b",
+    "zyxel": r"\bzyxel\b|\bvmg\d{4}",
+    "juniper": r"\bjuniper\b|\bjunos\b",
+    "mikrotik": r"\bmikrotik\b|\brouteros\b",
+    "dell": r"\bdell\b|\bidrac\b|\bpoweredge\b",
+}
+_VENDOR_RES = {vendor: re.compile(pattern, re.IGNORECASE) for vendor, pattern in VENDOR_PATTERNS.items()}
+
+# Checked against the file name in order; the first match wins
+DOC_TYPE_PATTERNS = [
+    ("email", r"mail|subject:"),
+    ("datasheet", r"datasheet|spec"),
+    ("configuration", r"konfig|config|setup|bridge|licen"),
+]
+
+# Model family: short letter prefix + 3-5 digits ("ISR 4431", "S5735-L", "DL 380")
+_MODEL_RE = re.compile(r"\b([a-z]{1,5})[\s-]?(\d{3,5})(?![\d.])", re.IGNORECASE)
+# Prefixes that look like a model but are CLI/protocol words
+_MODEL_STOPWORDS = {
+    "vlan", "port", "page", "step", "gen", "rfc", "iso", "ieee", "tcp", "udp", "ip",
+    "ge", "gi", "xe", "te", "eth", "fa", "vl", "as", "id", "no", "v", "x", "p",
+}
+
+# How much of a document is scanned for content tags
+SAMPLE_CHARS = 5000
+
+
+def model_families(text: str) -> list[str]:
+    """Normalized model families of all model-like tokens in `text`."""
+    families = []
+    for match in _MODEL_RE.finditer(text or ""):
+        prefix = match.group(1).lower()
+        if prefix not in _MODEL_STOPWORDS:
+            families.append(prefix + match.group(2))
+    return families
+
+
+def model_family(text: str) -> Optional[str]:
+    """
+    Normalized model family of the first model-like token in `text`,
+    e.g. "ISR4431/K9" -> "isr4431", "HPE ProLiant DL 380 Gen10" -> "dl380".
+    """
+    families = model_families(text)
+    return families[0] if families else None
+
+
+def detect_vendor(text: str) -> Optional[str]:
+    counts = Counter({vendor: len(regex.findall(text or "")) for vendor, regex in _VENDOR_RES.items()})
+    vendor, count = counts.most_common(1)[0]
+    return vendor if count else None
+
+
+def detect_tags(source: str, sample: str, known_models: Iterable[str] = ()) -> dict:
+    """
+    Vendor / model / doc_type for a document. The file name wins over the
+    content; models come from the file name or from inventory models
+    (`known_models`, i.e. Device.model values) mentioned in the text.
+    Fields that cannot be determined are left out.
+    """
+    # Sources may be Windows paths (collections ingested on another machine)
+    name = re.split(r"[\\/]", source)[-1]
+    stem = os.path.splitext(name)[0].replace("_", " ")
+    sample = (sample or "")[:SAMPLE_CHARS]
+
+    tags = {}
+    vendor = detect_vendor(stem) or detect_vendor(sample)
+    if vendor:
+        tags["vendor"] = vendor
+
+    model = model_family(stem)
+    if not model:
+        lowered = re.sub(r"[\s-]", "", sample.lower())
+        for known in known_models:
+            family = model_family(known)
+            if family and family in lowered:
+                model = family
+                break
+    if model:
+        tags["model"] = model
+
+    for doc_type, pattern in DOC_TYPE_PATTERNS:
+        if re.search(pattern, name, re.IGNORECASE):
+            tags["doc_type"] = doc_type
+            break
+    else:
+        tags["doc_type"] = "manual" if name.lower().endswith(".pdf") else "note"
+    return tags
+
+
+def device_scopes(device) -> list[dict]:
+    """Filters for a Device, narrowest first: its model family, then its vendor."""
+    scopes = []
+    family = model_family(device.model or "")
+    if family:
+        scopes.append({"model": family})
+    vendor = detect_vendor(" ".join(filter(None, [device.model, device.device_type, device.os_family])))
+    if vendor:
+        scopes.append({"vendor": vendor})
+    return scopes
+
+
+def scopes_for_question(question: str, devices: Iterable = (), indexed: Optional[dict] = None) -> list[dict]:
+    """
+    Retrieval filters implied by the question, narrowest first.
+    A hostname from the inventory scopes to that device's model/vendor;
+    otherwise a model family or vendor named in the text is used.
+    With `indexed` ({field: set of tagged values}, see RagEngine.indexed_tags)
+    scopes that no chunk is tagged with are dropped.
+    Empty list = search the whole collection.
+    """
+    lowered = (question or "").lower()
+    scopes = []
+    for device in devices:
+        hostname = (device.hostname or "").lower()
+        if hostname and re.search(rf"(?<![\w.-]){re.escape(hostname)}(?![\w-])", lowered):
+            scopes.extend(s for s in device_scopes(device) if s not in scopes)
+
+    if not scopes:
+        scopes.extend({"model": family} for family in dict.fromkeys(model_families(question)))
+        vendor = detect_vendor(question)
+        if vendor:
+            scopes.append({"vendor": vendor})
+
+    if indexed is not None:
+        scopes = [s for s in scopes if all(v in indexed.get(f, ()) for f, v in s.items())]
+    return scopes
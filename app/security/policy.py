@@ -0,0 +1,234 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# Patterns blocked on every OS family, matched anywhere in the command
+BLACKLISTED_COMMANDS = [
+    r"rm\s+-rf",
+    r"mkfs",
+    r"dd\s+if=",
+    r":\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:",  # Fork bomb
+    r">\s*/dev/sda",
+    r"mv\s+/*\s+/dev/null",
+    r"shutdown",
+    r"reboot",
+    r"init\s+0",
+]
+
+# Extra Linux rules, matched anywhere in the command
+LINUX_DENY = [
+    r">\s*/dev/(sd[a-z]|nvme\d|vd[a-z])",
+]
+
+# Matched at the start of each command segment
+LINUX_DENY_COMMANDS = [
+    r"(sudo\s+)?halt\b",
+    r"(sudo\s+)?poweroff\b",
+]
+
+# Cisco IOS / Huawei VRP / Junos rules
+NETWORK_DENY = [
+    r"write\s+erase",
+    r"erase\s+(startup-config|nvram|flash)",
+    r"reset\s+saved-configuration",
+    r"request\s+system\s+(reboot|halt|power-off|zeroize)",
+]
+
+NETWORK_DENY_COMMANDS = [
+    r"reload\b",
+    r"format\b",
+    r"delete\b",
+]
+
+# Inventory values are free-form (CSV import), so map them onto rule sets
+_OS_FAMILY_ALIASES = {
+    "linux": "linux",
+    "network_ios": "network",
+    "cisco_ios": "network",
+    "ios": "network",
+    "ios-xe": "network",
+    "ios-xr": "network",
+    "nx-os": "network",
+    "junos": "network",
+    "vrp": "network",
+    "huawei": "network",
+}
+
+
+# Characters that can start a new command or change how separators are read
+_SPECIAL_CHARS = re.compile(r"[;&|\n$`'\"\\]")
+_TOKEN_RE = re.compile(
+    r"'[^']*'?"                 # single-quoted string
+    r'|"(?:\\.|[^"\\])*"?'      # double-quoted string
+    r"|\\.|\$\(|`|[;&|\n]"      # escape, subshell openers, separators
+    r"|[^;&|\n'\"\\$`]+|.",     # plain text
+    re.DOTALL,
+)
+
+
+def split_command(command: str) -> List[str]:
+    """
+    Splits a command line into the individual commands it would run.
+    Separators are `;`, `&`, `|` (so also `&&`, `||`) and newlines, except
+    inside quotes. The contents of `$(...)` and backtick subshells, including
+    those inside double quotes, are returned as additional segments.
+    """
+    if not _SPECIAL_CHARS.search(command):
+        stripped = command.strip()
+        return [stripped] if stripped else []
+
+    segments = []
+    current = []
+    pos = 0
+    n = len(command)
+    while pos < n:
+        token = _TOKEN_RE.match(command, pos).group()
+        start = pos
+        pos += len(token)
+        if token in (";", "&", "|", "\n"):
+            segments.append("".join(current))
+            current = []
+        elif token == "$(":
+            # Find the matching parenthesis and recurse into the subshell
+            depth = 1
+            while pos < n and depth:
+                if command[pos] == "(":
+                    depth += 1
+                elif command[pos] == ")":
+                    depth -= 1
+                pos += 1
+            segments.extend(split_command(command[start + 2:pos - 1]))
+            current.append(command[start:pos])
+        elif token == "`":
+            end = command.find("`", pos)
+            end = n if end == -1 else end
+            segments.extend(split_command(command[pos:end]))
+            current.append(command[start:end + 1])
+            pos = end + 1
+        else:
+            if token.startswith('"') and ("$(" in token or "`" in token):
+                # Double quotes do not stop command substitution
+                segments.extend(split_command(token[1:-1]))
+            current.append(token)
+
+    segments.append("".join(current))
+    return [s.strip() for s in segments if s.strip()]
+
+
+def _leading_literal(pattern: str) -> str:
+    """
+    Returns the literal text every match of `pattern` must start with
+    (lowercased), or "" if it cannot be determined cheaply.
+    """
+    depth = 0
+    escaped = False
+    for ch in pattern:
+        # A top-level alternation means the prefix is not required
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return ""
+    match = re.match(r"[\w\-/=:><]+", pattern)
+    if not match:
+        return ""
+    literal = match.group()
+    # A trailing quantifier applies to the last character only
+    if pattern[len(literal):len(literal) + 1] in ("*", "?", "{"):
+        literal = literal[:-1]
+    return literal.lower()
+
+
+def _compile_alternation(patterns: Iterable[str]) -> Optional[re.Pattern]:
+    """Compiles all patterns into one regex; the matching group name identifies the rule."""
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?P<r{i}>{p})" for i, p in enumerate(patterns)), re.IGNORECASE)
+
+
+class CommandPolicy:
+    """
+    Allow/deny rule set for one OS family, compiled once.
+
+    - `deny`: patterns searched anywhere in the raw command. Each rule is gated
+      by its literal prefix (a plain substring test), so the regex only runs
+      when the rule can possibly match.
+    - `deny_commands`: patterns matched at the start of every command segment
+      (after splitting on pipes, `;`, `&&`, `||` and subshells), compiled into
+      one alternation.
+    - `allow`: if given, every segment must start with one of these.
+    """
+
+    def __init__(self,
+                 name: str,
+                 deny: Iterable[str] = (),
+                 deny_commands: Iterable[str] = (),
+                 allow: Iterable[str] = ()):
+        self.name = name
+        self.deny = list(deny)
+        self.deny_commands = list(deny_commands)
+        self.allow = list(allow)
+        self._deny_rules = [
+            (_leading_literal(p), re.compile(p, re.IGNORECASE), p) for p in self.deny
+        ]
+        self._deny_commands_re = _compile_alternation(self.deny_commands)
+        self._allow_re = _compile_alternation(self.allow)
+
+    def evaluate(self, command: str) -> Tuple[bool, str]:
+        """
+        Returns (is_safe, reason) for the command.
+        """
+        if not command or not command.strip():
+            return False, "Empty command"
+
+        lowered = command.lower()
+        for literal, regex, pattern in self._deny_rules:
+            if literal in lowered and regex.search(command):
+                return False, f"Command contains blacklisted pattern: {pattern}"
+
+        if self._deny_commands_re or self._allow_re:
+            for segment in split_command(command):
+                if self._deny_commands_re:
+                    match = self._deny_commands_re.match(segment)
+                    if match:
+                        pattern = self.deny_commands[int(match.lastgroup[1:])]
+                        return False, f"Command contains blacklisted pattern: {pattern}"
+                if self._allow_re and not self._allow_re.match(segment):
+                    return False, f"Command not in allow list for {self.name}: {segment}"
+
+        return True, "Safe"
+
+
+POLICIES = {
+    "default": CommandPolicy("default", deny=BLACKLISTED_COMMANDS),
+    "linux": CommandPolicy(
+        "linux",
+        deny=BLACKLISTED_COMMANDS + LINUX_DENY,
+        deny_commands=LINUX_DENY_COMMANDS,
+    ),
+    "network": CommandPolicy(
+        "network",
+        deny=BLACKLISTED_COMMANDS + NETWORK_DENY,
+        deny_commands=NETWORK_DENY_COMMANDS,
+    ),
+}
+
+
+def get_policy(os_family: Optional[str] = None) -> CommandPolicy:
+    """Returns the rule set for an inventory os_family (unknown families get the default set)."""
+    key = _OS_FAMILY_ALIASES.get((os_family or "").strip().lower(), "default")
+    return POLICIES[key]
+
+
+@lru_cache(maxsize=8192)
+def check_command(command: str, os_family: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Memoized policy verdict. Call `check_command.cache_clear()` after changing POLICIES.
+    """
+    return get_policy(os_family).evaluate(command)
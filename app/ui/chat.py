@@ -17,7 +17,11 @@ print(f"[DB] Active data layer (cl.data_layer)      = {type(getattr(cl, 'data_la
 import sys
 import os
 import json
-import re
+import base64
+import uuid
+import asyncio
+import hashlib
+import tempfile
 from dotenv import load_dotenv
 
 # Ensure the root directory is in sys.path
@@ -25,7 +29,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 from app.data.inventory_repo import InventoryRepository
 from app.llm.client import get_llm
+from app.llm.action_parser import ActionStreamParser
 from app.rag.engine import RagEngine
+from app.rag.context import ContextAssembler
+from app.rag.retrieval import retrieve_context
 from chainlit.input_widget import Select, Switch, Slider
 import app.core.persistence as p
 import chainlit.data as cl_data
@@ -71,6 +78,8 @@ if hasattr(genai, "GenerationConfig") and not hasattr(genai.GenerationConfig, "M
     setattr(genai.GenerationConfig, "MediaResolution", MediaResolution)
 
 from app.core.execution import ConnectionManager
+from app.core.netmiko_pool import close_netmiko_pool
+from app.core.ssh_pool import close_ssh_pool
 from langchain_core.messages import HumanMessage
 
 from app.core.persistence import SQLiteDataLayer
@@ -86,37 +95,109 @@ else:
     print("[AUTH] WARNING: CHAINLIT_AUTH_SECRET not found in .env")
 
 rag_engine = RagEngine()
+# Packs retrieved chunks into the prompt (RAG_CONTEXT_TOKENS budget)
+context_assembler = ContextAssembler()
+# One repository per process (shared engine + device index)
+inventory_repo = InventoryRepository()
+
+# Upper bound on command output kept in a single chat message
+MAX_STREAMED_OUTPUT = 200_000
+# Minimum seconds between fan-out table updates
+FANOUT_UPDATE_INTERVAL = float(os.getenv("FANOUT_UPDATE_INTERVAL", "1.0"))
 
 # --- PERSISTENCE SETUP ---
 # (Data layer already registered at top)
 
-def extract_json_action(text: str):
+def _content_text(content) -> str:
+    """LangChain message content is either a string or a list of content blocks."""
+    if isinstance(content, list):
+        return "".join([p['text'] for p in content if isinstance(p, dict) and 'text' in p])
+    return str(content)
+
+def _approval_actions(action_data: dict) -> list:
+    """ODOBRI / ODBIJI buttons for a proposed action."""
+    # FIX: payload is now required in Chainlit 2.x
+    return [
+        cl.Action(
+            name="approve_execution", 
+            value=json.dumps(action_data), 
+            payload=action_data,
+            label="✅ ODOBRI", 
+            description=f"Run {action_data.get('command')}"
+        ),
+        cl.Action(
+            name="reject_execution", 
+            value="cancel", 
+            payload={}, # Empty payload for reject
+            label="❌ ODBIJI"
+        )
+    ]
+
+def _action_summary(action_data: dict) -> str:
+    hosts = action_data.get('hostname') or ', '.join(action_data.get('hostnames') or [])
+    return f"\n\n> **Prijedlog Akcije** ⚡\n> - **Host:** `{hosts}`\n> - **Naredba:** `{action_data.get('command')}`\n> - **Razlog:** {action_data.get('reason')}"
+
+def _fanout_row(hostname: str, ok: bool, output: str) -> str:
+    """One markdown table row for a finished host."""
+    status = "✅" if ok else "❌"
+    # Keep the table readable: first line only, pipes escaped
+    first_line = (output.strip().splitlines() or [""])[0][:120].replace("|", "\\|")
+    return f"| `{hostname}` | {status} | `{first_line}` |"
+
+def _format_fanout_table(command: str, table_rows: list, total: int) -> str:
     """
-    Attempts to extract a JSON block from the text.
-    Looking for ```json ... ``` or just { ... } at the end.
+    Renders fan-out results as a markdown table (rows from _fanout_row, one per finished host).
     """
-    # Regex for json block code
-    json_block = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
-    if json_block:
-        try:
-            return json.loads(json_block.group(1))
-        except:
-            pass
-    
-    # Fallback: find last curly brace pair
-    try:
-        # Simplistic heuristic: find first { and last }
-        # logic: start searching from the end to find the last valid JSON object
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            potential_json = text[start:end+1]
-            # Verify if it's valid json
-            return json.loads(potential_json)
-    except:
-        pass
-    
-    return None
+    lines = [
+        f"🚀 Izvršavam: `{command}` na {total} uređaja ({len(table_rows)}/{total} gotovo)",
+        "",
+        "| Host | Status | Rezultat |",
+        "|---|---|---|",
+    ]
+    return "\n".join(lines + table_rows)
+
+def _truncate(output: str, limit: int) -> str:
+    if len(output) <= limit:
+        return output
+    return output[:limit] + f"\n... [izlaz skraćen nakon {limit} znakova]"
+
+async def _run_fanout(msg: cl.Message, conn_mgr: ConnectionManager, repo: InventoryRepository, hostnames: list, command: str):
+    """
+    Executes the command on several hosts and updates the table as results arrive
+    (at most every FANOUT_UPDATE_INTERVAL seconds, so hundreds of hosts do not
+    mean hundreds of full-table resends).
+    """
+    results = []
+    table_rows = []
+    devices = []
+    # Off the event loop: a cold/expired device index reloads the whole table
+    lookups = await cl.make_async(lambda: [repo.get_device_by_hostname(h) for h in hostnames])()
+    for hostname, device in zip(hostnames, lookups):
+        if device:
+            devices.append(device)
+        else:
+            results.append((hostname, "Uređaj nije pronađen u inventaru."))
+            table_rows.append(_fanout_row(hostname, False, results[-1][1]))
+
+    msg.content = _format_fanout_table(command, table_rows, len(hostnames))
+    await msg.update()
+
+    loop = asyncio.get_running_loop()
+    last_update = loop.time()
+    async for device, result in conn_mgr.execute_many(devices, command):
+        ok = not result.startswith(("Error", "Connection Failed", "Netmiko Failed", "Timeout", "Unsupported"))
+        results.append((device.hostname, result))
+        table_rows.append(_fanout_row(device.hostname, ok, result))
+        if loop.time() - last_update >= FANOUT_UPDATE_INTERVAL:
+            msg.content = _format_fanout_table(command, table_rows, len(hostnames))
+            await msg.update()
+            last_update = loop.time()
+
+    # Full outputs share the single-message cap
+    per_host = max(MAX_STREAMED_OUTPUT // max(len(results), 1), 200)
+    details = "\n\n".join(f"**{hostname}:**\n```\n{_truncate(output, per_host)}\n```" for hostname, output in results)
+    msg.content = _format_fanout_table(command, table_rows, len(hostnames)) + "\n\n" + details
+    await msg.update()
 
 @cl.action_callback("approve_execution")
 async def on_approve(action: cl.Action):
@@ -131,32 +212,55 @@ async def on_approve(action: cl.Action):
             payload = json.loads(action.value)
             
         hostname = payload.get("hostname")
+        hostnames = payload.get("hostnames") or []
         command = payload.get("command")
         
         await action.remove() # Remove buttons to prevent double-click
         
+        # 1. Setup Connection Manager
+        ssh_key = os.getenv("SSH_KEY_PATH")
+        # Warn if no key key but proceed (might be password auth if we implemented it, but we standardized on key)
+        
+        conn_mgr = ConnectionManager(private_key_path=ssh_key)
+
+        # Fan-out: same command on several devices
+        if len(hostnames) > 1:
+            msg = cl.Message(content=f"🚀 Izvršavam: `{command}` na {len(hostnames)} uređaja...")
+            await msg.send()
+            await _run_fanout(msg, conn_mgr, inventory_repo, hostnames, command)
+            return
+        hostname = hostname or (hostnames[0] if hostnames else None)
+        
         msg = cl.Message(content=f"🚀 Izvršavam: `{command}` na `{hostname}`...")
         await msg.send()
         
-        # 1. Fetch Device Params from DB
-        repo = InventoryRepository()
-        device = repo.get_device_by_hostname(hostname)
+        # 2. Fetch Device Params (device index; off the event loop in case it has to reload)
+        device = await cl.make_async(inventory_repo.get_device_by_hostname)(hostname)
         
         if not device:
             msg.content = f"❌ Greška: Uređaj `{hostname}` nije pronađen u inventaru."
             await msg.update()
             return
-
-        # 2. Setup Connection Manager
-        ssh_key = os.getenv("SSH_KEY_PATH")
-        # Warn if no key key but proceed (might be password auth if we implemented it, but we standardized on key)
-        
-        conn_mgr = ConnectionManager(private_key_path=ssh_key)
-        
-        # 3. Execute
-        result = await conn_mgr.execute(device, command)
         
-        msg.content = f"✅ **Rezultat ({hostname}):**\n```\n{result}\n```"
+        # 3. Execute (output is streamed into the message as it arrives)
+        msg.content = f"✅ **Rezultat ({hostname}):**\n```\n"
+        await msg.update()
+
+        streamed = 0
+        stream = conn_mgr.execute_stream(device, command)
+        try:
+            async for chunk in stream:
+                if streamed + len(chunk) > MAX_STREAMED_OUTPUT:
+                    await msg.stream_token(chunk[:MAX_STREAMED_OUTPUT - streamed])
+                    await msg.stream_token(f"\n... [izlaz skraćen nakon {MAX_STREAMED_OUTPUT} znakova]")
+                    break
+                streamed += len(chunk)
+                await msg.stream_token(chunk)
+        finally:
+            # Stops the remote command if we broke out early
+            await stream.aclose()
+
+        await msg.stream_token("\n```")
         await msg.update()
         
     except Exception as e:
@@ -195,18 +299,61 @@ async def set_starters():
             ),
     ]
 
+@cl.on_app_startup
+async def on_app_startup():
+    """
+    Once per process: inventory schema check/migration and device index warm-up,
+    so chat sessions and the first approval never touch the DB for it.
+    """
+    try:
+        await cl.make_async(inventory_repo.initialize_db)()
+        devices = await cl.make_async(inventory_repo.get_all_devices)()
+        print(f"[INVENTORY] Ready ({len(devices)} devices)")
+    except Exception as e:
+        print(f"[INVENTORY] Startup failed: {e}")
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    """Closes warm device sessions so they do not hold VTY lines after the app stops."""
+    await close_ssh_pool()
+    await cl.make_async(close_netmiko_pool)()
+
 @cl.on_chat_start
 async def start():
-    repo = InventoryRepository()
-    repo.initialize_db()
-    # Clean start - no welcome message
+    # Clean start - no welcome message, no DB work (schema is set up in on_app_startup)
+    pass
+
+def _encode_image(path: str, mime: str) -> dict:
+    """Reads an uploaded image into a base64 content block for the LLM."""
+    with open(path, "rb") as f:
+        b64_img = base64.b64encode(f.read()).decode('utf-8')
+    return {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64_img}"}}
+
+def _load_inventory(repo: InventoryRepository) -> list:
+    try:
+        return repo.get_all_devices()
+    except Exception as e:
+        print(f"[INVENTORY] Lookup failed: {e}")
+        return []
+
+async def _retrieve_context(question: str, repo: InventoryRepository):
+    """
+    Scoped RAG for the question (see app.rag.retrieval.retrieve_context);
+    the inventory is loaded off the event loop while the question is embedded.
+    Returns (context chunks packed to the token budget, devices).
+    """
+    load_devices = lambda: cl.make_async(_load_inventory)(repo)
+    # Only use RAG if there is text to query, otherwise context is empty
+    if not question:
+        return [], await load_devices()
+    return await retrieve_context(rag_engine, context_assembler, question, load_devices)
 
 @cl.on_message
 async def main(message: cl.Message):
     llm = get_llm()
     
     # --- FILE HANDLING (CSV/PDF/IMAGES) ---
-    image_content = []
+    image_elements = []
     
     if message.elements:
         for element in message.elements:
@@ -215,25 +362,19 @@ async def main(message: cl.Message):
             elif "csv" in element.mime or element.name.endswith(".csv"):
                 await handle_csv(element)
             elif "image" in element.mime:
-                # Store images to send to LLM
-                with open(element.path, "rb") as f:
-                    image_data = f.read()
-                    import base64
-                    b64_img = base64.b64encode(image_data).decode('utf-8')
-                    image_content.append(
-                        {"type": "image_url", "image_url": {"url": f"data:{element.mime};base64,{b64_img}"}}
-                    )
+                # Images are encoded below, together with the other lookups
+                image_elements.append(element)
         
         # If message has no text AND no images, prompt might be empty.
-        if not message.content and not image_content:
+        if not message.content and not image_elements:
             return 
     
-    # --- RAG ---
-    # Only use RAG if there is text to query, otherwise context is empty
-    context_str = ""
-    if message.content:
-        context_chunks = rag_engine.query(message.content)
-        context_str = "\n\n".join(context_chunks)
+    # --- INVENTORY -> RAG, IMAGES (concurrently, off the event loop) ---
+    (context_chunks, _), image_content = await asyncio.gather(
+        _retrieve_context(message.content, inventory_repo),
+        asyncio.gather(*(cl.make_async(_encode_image)(e.path, e.mime) for e in image_elements)),
+    )
+    context_str = "\n\n".join(context_chunks)
 
     # --- PROMPT FOR ACTION ---
     system_instruction = f"""Ti si AI SysAdmin Agent.
@@ -261,8 +402,17 @@ Objasni plan riječima, a zatim dodaj:
 }}
 ```
 
+Ako istu naredbu treba izvršiti na više uređaja (npr. 'provjeri disk na svim Linux serverima'), umjesto `hostname` vrati listu:
+```json
+{{
+  "hostnames": ["HOSTNAME_1", "HOSTNAME_2"],
+  "command": "EXACT_CLI_COMMAND",
+  "reason": "Kratko objašnjenje zašto"
+}}
+```
+
 Pazi:
-1. `hostname` mora odgovarati hostnamu iz inventara (ako znaš, ili pretpostavi iz razgovora).
+1. `hostname` (ili svaki element `hostnames`) mora odgovarati hostnamu iz inventara (ako znaš, ili pretpostavi iz razgovora).
 2. `command` mora biti sigurna (nema `rm -rf` itd.).
 
 DANAŠNJI ZAHTJEV: {message.content}
@@ -284,48 +434,38 @@ DANAŠNJI ZAHTJEV: {message.content}
              
         user_message_content.extend(image_content)
         
-        response = llm.invoke([HumanMessage(content=user_message_content)])
-        
-        # Langchain response content handling
-        content_text = response.content
-        if isinstance(content_text, list):
-            content_text = "".join([p['text'] for p in content_text if 'text' in p])
-        else:
-            content_text = str(content_text)
-            
-        # Detect Action
-        action_data = extract_json_action(content_text)
-        
-        # Remove JSON from display text to make it cleaner
-        display_text = re.sub(r"```json\s*\{.*?\}\s*```", "", content_text, flags=re.DOTALL).strip()
-        if not display_text:
-            display_text = "Generirao sam prijedlog akcije (vidi dolje):"
-
-        msg = cl.Message(content=display_text)
-        
-        if action_data:
-            # Create Actions
-            # FIX: payload is now required in Chainlit 2.x
-            actions = [
-                cl.Action(
-                    name="approve_execution", 
-                    value=json.dumps(action_data), 
-                    payload=action_data,
-                    label="✅ ODOBRI", 
-                    description=f"Run {action_data.get('command')}"
-                ),
-                cl.Action(
-                    name="reject_execution", 
-                    value="cancel", 
-                    payload={}, # Empty payload for reject
-                    label="❌ ODBIJI"
-                )
-            ]
-            msg.actions = actions
+        # Stream the answer; the ```json action block is hidden and the
+        # approval buttons are attached as soon as it closes
+        msg = cl.Message(content="")
+        parser = ActionStreamParser()
+        actions = []
+
+        async def attach_actions():
+            # The message has to exist in the UI before actions can point at it
+            if not msg.content.strip():
+                await msg.stream_token("Generirao sam prijedlog akcije (vidi dolje):")
+            actions.extend(_approval_actions(parser.action))
+            await asyncio.gather(*(action.send(for_id=msg.id) for action in actions))
+
+        async for chunk in llm.astream([HumanMessage(content=user_message_content)]):
+            visible = parser.feed(_content_text(chunk.content))
+            if visible:
+                await msg.stream_token(visible)
+            if parser.action and not actions:
+                await attach_actions()
+
+        rest = parser.finish()
+        if rest:
+            await msg.stream_token(rest)
+        if parser.action:
+            if not actions:
+                await attach_actions()
             # Add explicit text about the action details in the message body too
-            msg.content += f"\n\n> **Prijedlog Akcije** ⚡\n> - **Host:** `{action_data.get('hostname')}`\n> - **Naredba:** `{action_data.get('command')}`\n> - **Razlog:** {action_data.get('reason')}"
-            
+            await msg.stream_token(_action_summary(parser.action))
+
         await msg.send()
+        # Already sent above; kept on the message for later bookkeeping
+        msg.actions = actions
 
     except Exception as e:
         await cl.Message(content=f"Greška: {str(e)}").send()
@@ -345,17 +485,125 @@ async def handle_pdf(element):
         msg.content = f"❌ Greška: {e}"
         await msg.update()
 
+def _format_rejections(rejected: list) -> str:
+    # Show the first few rejections; the rest only as a count
+    lines = [f"- red {r['row']} (`{r['hostname']}`): {r['reason']}" for r in rejected[:20]]
+    if len(rejected) > 20:
+        lines.append(f"- ... i još {len(rejected) - 20}")
+    return f"\n\n⚠️ Odbijeno {len(rejected)} redova:\n" + "\n".join(lines)
+
+def _format_sync_report(report: dict) -> str:
+    def names(hostnames: list) -> str:
+        shown = ", ".join(f"`{h}`" for h in hostnames[:10])
+        return shown + (f" ... (+{len(hostnames) - 10})" if len(hostnames) > 10 else "")
+
+    title = "🔍 **Pregled sinkronizacije** (ništa još nije zapisano)" if report["dry_run"] else "✅ **Inventar sinkroniziran**"
+    lines = [
+        title,
+        f"- ➕ Novi: {len(report['inserted'])} {names(report['inserted'])}",
+        f"- ✏️ Izmijenjeni: {len(report['updated'])} {names(report['updated'])}",
+        f"- 🗑️ Uklonjeni (nema ih u CSV-u): {len(report['removed'])} {names(report['removed'])}",
+        f"- ⏸️ Nepromijenjeni: {report['unchanged']}",
+    ]
+    text = "\n".join(lines)
+    if report["rejected"]:
+        text += _format_rejections(report["rejected"])
+    return text
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _pop_pending_sync(token: str) -> dict | None:
+    """Removes and returns a sync preview of this session (None if unknown/expired)."""
+    pending = cl.user_session.get("pending_syncs") or {}
+    entry = pending.pop(token, None)
+    cl.user_session.set("pending_syncs", pending)
+    return entry
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 async def handle_csv(element):
     msg = cl.Message(content=f"📊 Uvozim CSV: {element.name}...")
     await msg.send()
+    # Private copy per upload: another upload with the same name can't replace it
+    fd, temp_path = tempfile.mkstemp(prefix="inventory_", suffix=".csv")
+    keep_file = False
     try:
-        temp_path = f"temp_{element.name}"
-        with open(temp_path, "wb") as f:
+        with os.fdopen(fd, "wb") as f:
             with open(element.path, "rb") as s: f.write(s.read())
-        repo = InventoryRepository()
-        count = await cl.make_async(repo.bulk_import_from_csv)(temp_path)
-        msg.content = f"✅ Dodano {count} uređaja."
+        if await cl.make_async(inventory_repo.has_devices)():
+            # Re-import: show what would change and let the user confirm
+            report = await cl.make_async(inventory_repo.sync_from_csv)(temp_path, dry_run=True)
+            msg.content = _format_sync_report(report)
+            if report["inserted"] or report["updated"] or report["removed"]:
+                # The client only gets an opaque token; path and file hash stay in the session
+                token = uuid.uuid4().hex
+                pending = cl.user_session.get("pending_syncs") or {}
+                pending[token] = {"path": temp_path, "sha256": await cl.make_async(_file_sha256)(temp_path)}
+                cl.user_session.set("pending_syncs", pending)
+                keep_file = True
+                msg.actions = [
+                    cl.Action(name="apply_inventory_sync", payload={"token": token, "remove_missing": True},
+                              label="✅ Sinkroniziraj (uklj. brisanje)"),
+                    cl.Action(name="apply_inventory_sync", payload={"token": token, "remove_missing": False},
+                              label="➕ Samo dodaj i ažuriraj"),
+                    cl.Action(name="cancel_inventory_sync", payload={"token": token}, label="❌ Odustani"),
+                ]
+            await msg.update()
+            return
+        report = await cl.make_async(inventory_repo.bulk_import_from_csv)(temp_path)
+        msg.content = f"✅ Dodano {report['inserted']} od {report['rows']} uređaja."
+        if report["rejected"]:
+            msg.content += _format_rejections(report["rejected"])
         await msg.update()
     except Exception as e:
         msg.content = f"❌ Greška: {e}"
         await msg.update()
+    finally:
+        if not keep_file:
+            _remove_file(temp_path)
+
+@cl.action_callback("apply_inventory_sync")
+async def on_apply_sync(action: cl.Action):
+    """
+    Callback when user confirms a sync preview.
+    """
+    await action.remove()
+    payload = action.payload or {}
+    entry = _pop_pending_sync(payload.get("token", ""))
+    if entry is None:
+        await cl.Message(content="⚠️ Pregled sinkronizacije je istekao ili je već primijenjen. Pošalji CSV ponovno.").send()
+        return
+    msg = cl.Message(content="🔄 Sinkroniziram inventar...")
+    await msg.send()
+    try:
+        # Apply exactly the file that was previewed
+        if not os.path.exists(entry["path"]) or await cl.make_async(_file_sha256)(entry["path"]) != entry["sha256"]:
+            msg.content = "❌ CSV se promijenio nakon pregleda. Pošalji ga ponovno."
+        else:
+            # Recomputed against the current inventory, written in one transaction
+            report = await cl.make_async(inventory_repo.sync_from_csv)(
+                entry["path"], dry_run=False, remove_missing=bool(payload.get("remove_missing", True))
+            )
+            msg.content = _format_sync_report(report)
+    except Exception as e:
+        msg.content = f"❌ Greška: {e}"
+    finally:
+        _remove_file(entry["path"])
+    await msg.update()
+
+@cl.action_callback("cancel_inventory_sync")
+async def on_cancel_sync(action: cl.Action):
+    await action.remove()
+    entry = _pop_pending_sync((action.payload or {}).get("token", ""))
+    if entry is not None:
+        _remove_file(entry["path"])
+    await cl.Message(content="🚫 Sinkronizacija otkazana, inventar nije mijenjan.").send()
@@ -1,6 +1,8 @@
+import os
 import json
 import uuid
-import aiosqlite
+import base64
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
@@ -11,7 +13,90 @@ from chainlit.element import ElementDict
 from chainlit.step import StepDict
 
 # IMPORT: Sada je ispravan jer smo popravili ime varijable u db.py
-from app.ui.db import DB_NAME, ensure_db_init 
+from app.ui.db import DB_NAME, ensure_db_init, get_connection, close_connection, write_lock
+from app.ui.step_writer import StepWriteBehind
+
+# Stupci stepa koje UI stvarno prikazuje (ostali se ne čitaju iz baze)
+STEP_COLUMNS = "id, name, type, threadId, parentId, isError, metadata, tags, input, output, createdAt, start, end, showInput, language, defaultOpen"
+
+def _json_or(raw, default):
+    """Dekodira JSON samo kad ima sadržaja; prazne vrijednosti ne idu kroz json.loads."""
+    if not raw or raw == "{}" or raw == "[]":
+        return default
+    return json.loads(raw)
+
+def _encode_cursor(created_at: str, row_id: str) -> str:
+    """Keyset cursor (createdAt, id) kao neproziran string; ne ovisi o tome postoji li thread/step još."""
+    return base64.urlsafe_b64encode(json.dumps([created_at, row_id]).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Optional[tuple]:
+    """(createdAt, id) iz cursora, ili None ako to nije cursor u tom formatu (npr. stari cursor = samo id)."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    return created_at, row_id
+
+class _RawJSON:
+    """JSON tekst iz baze koji se dekodira tek kad ga netko zatraži."""
+    __slots__ = ("raw", "default")
+
+    def __init__(self, raw, default):
+        self.raw = raw
+        self.default = default
+
+class _LazyStep(dict):
+    """
+    Step dict koji metadata/tags dekodira pri prvom pristupu, ne pri učitavanju
+    threada. Pristup, kopiranje ({**step}, dict(step)) i serijalizacija (items())
+    uvijek vide dekodirane vrijednosti.
+    """
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, _RawJSON):
+            value = _json_or(value.raw, value.default)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __iter__(self):
+        # Nadjačan da dict(step) / {**step} idu kroz __getitem__ umjesto izravno po spremniku
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def copy(self):
+        return dict(self)
+
+def _step_from_row(s) -> Dict[str, Any]:
+    return _LazyStep({
+        "id": s[0],
+        "name": s[1],
+        "type": s[2],
+        "threadId": s[3],
+        "parentId": s[4],
+        "disableFeedback": False,
+        "streaming": False,
+        "waitForAnswer": False,
+        "isError": bool(s[5]),
+        "metadata": _RawJSON(s[6], {}),
+        "tags": _RawJSON(s[7], []),
+        "input": s[8] or "",
+        "output": s[9] or "",
+        "createdAt": s[10],
+        "start": s[11],
+        "end": s[12],
+        "showInput": s[13],
+        "language": s[14],
+        "defaultOpen": bool(s[15])
+    })
 
 class SQLiteDataLayer(BaseDataLayer):
     """
@@ -21,9 +106,31 @@ class SQLiteDataLayer(BaseDataLayer):
     
     def __init__(self):
         self.db_path = DB_NAME
+        self._step_writer = StepWriteBehind()
+        # Koliko zadnjih stepova get_thread učitava (0 = svi). Default je 0 jer
+        # Chainlit UI ne zna dohvatiti starije stepove (stepsCursor / get_thread_steps),
+        # pa bi prozor pri nastavku razgovora sakrio ostatak povijesti. Postavi ga
+        # kad su threadovi toliko dugi da je bitan samo nedavni kontekst.
+        self.thread_steps_window = int(os.getenv("THREAD_STEPS_WINDOW", "0"))
         print(f"[DB] SQLiteDataLayer inicijaliziran na: {self.db_path}")
         
     
+    @asynccontextmanager
+    async def _read(self):
+        """Dijeljena konekcija za čitanje"""
+        yield await get_connection()
+
+    @asynccontextmanager
+    async def _write(self):
+        """Dijeljena konekcija uz write lock; rollback ako naredba padne prije commita"""
+        db = await get_connection()
+        async with write_lock:
+            try:
+                yield db
+            except Exception:
+                await db.rollback()
+                raise
+
     def _get(self, obj, key, default=None):
         """Helper metoda za dohvaćanje vrijednosti iz dict ili objekta"""
         if isinstance(obj, dict):
@@ -34,12 +141,13 @@ class SQLiteDataLayer(BaseDataLayer):
         return ""
     
     async def close(self):
-        pass
+        await self._step_writer.close()
+        await close_connection()
 
     # --- USER METHODS ---
     async def get_user(self, identifier: str) -> Optional[PersistedUser]:
         await ensure_db_init()
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT id, identifier, metadata, createdAt FROM users WHERE identifier = ?",
                 (identifier,)
@@ -66,7 +174,7 @@ class SQLiteDataLayer(BaseDataLayer):
         metadata = self._get(user, "metadata") or {}
         created_at = datetime.utcnow().isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "INSERT OR IGNORE INTO users (id, identifier, metadata, createdAt) VALUES (?,?,?,?)",
                 (user_id, identifier, json.dumps(metadata), created_at)
@@ -76,24 +184,29 @@ class SQLiteDataLayer(BaseDataLayer):
         return PersistedUser(id=user_id, identifier=identifier, metadata=metadata, createdAt=created_at)
 
     # --- THREAD METHODS ---
-    async def get_thread(self, thread_id: str) -> Optional[ThreadDict]:
-        print(f"[DB] ENTER get_thread thread_id={thread_id}")
+    async def get_thread(self, thread_id: str, steps_limit: Optional[int] = None, steps_before: Optional[str] = None) -> Optional[ThreadDict]:
+        """
+        Vraća thread sa stepovima.
+        steps_limit: učitaj samo zadnjih N stepova (default THREAD_STEPS_WINDOW iz .env, inače svi).
+        steps_before: id stepa (cursor) - učitaj stepove starije od njega.
+        Ako postoje stariji stepovi, "stepsCursor" sadrži cursor za iduću stranicu
+        (za get_thread_steps).
+        """
         await ensure_db_init()
+        # Stepovi iz write-behind reda moraju biti vidljivi prije čitanja
+        await self._step_writer.flush()
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # Tolerantni pristup - prvo pokušaj s user filterom ako je dostupan
-            thread_row = None
-            
-            # Pokušaj 1: Naći thread samo po ID (fallback za kompatibilnost)
-            cursor = await db.execute("SELECT * FROM threads WHERE id = ?", (str(thread_id),))
+        async with self._read() as db:
+            cursor = await db.execute(
+                "SELECT id, createdAt, name, userId, userIdentifier, tags, metadata FROM threads WHERE id = ?",
+                (str(thread_id),)
+            )
             thread_row = await cursor.fetchone()
             
             if not thread_row:
-                print(f"[DB] NOT FOUND thread_id={thread_id} (tried fallback query)")
+                print(f"[DB] NOT FOUND thread_id={thread_id}")
                 return None
             
-            print(f"[DB] Found thread: id={thread_row[0]} name={thread_row[2]} userId={thread_row[3]}")
-            
             # Mapiranje rezultata - koristimo eksplicitne indekse za sigurnost
             thread_data = {
                 "id": thread_row[0],
@@ -101,79 +214,124 @@ class SQLiteDataLayer(BaseDataLayer):
                 "name": thread_row[2],
                 "userId": thread_row[3],
                 "userIdentifier": thread_row[4],
-                "tags": json.loads(thread_row[5]) if thread_row[5] else [],
-                "metadata": json.loads(thread_row[6]) if thread_row[6] else {},
+                "tags": _json_or(thread_row[5], []),
+                "metadata": _json_or(thread_row[6], {}),
                 "steps": [],
                 "elements": []
             }
 
-            # Učitaj sve stepove za thread, sortiraj po createdAt ASC
-            # Koristimo SELECT * da dobijemo sva polja iz baze
-            cursor = await db.execute(
-                "SELECT * FROM steps WHERE threadId = ? ORDER BY createdAt ASC", 
-                (str(thread_id),)
+            steps, steps_cursor = await self._load_steps(
+                db, str(thread_id), steps_limit or self.thread_steps_window, steps_before
             )
-            steps_rows = await cursor.fetchall()
-            
-            print(f"[DB] Found {len(steps_rows)} steps for thread {thread_id}")
-            
-            for s in steps_rows:
-                # Mapiranje prema strukturi baze (21 polje)
-                step = {
-                    "id": s[0],
-                    "name": s[1], 
-                    "type": s[2],
-                    "threadId": s[3],
-                    "parentId": s[4],
-                    # Dodatna polja iz baze
-                    "disableFeedback": bool(s[5]) if s[5] is not None else False,
-                    "streaming": bool(s[6]) if s[6] is not None else False,
-                    "waitForAnswer": bool(s[7]) if s[7] is not None else False,
-                    "isError": bool(s[8]) if s[8] is not None else False,
-                    "metadata": json.loads(s[9]) if s[9] else {},
-                    "tags": json.loads(s[10]) if s[10] else [],
-                    "input": s[11] or "",
-                    "output": s[12] or "",
-                    "createdAt": s[13],
-                    "start": s[14],
-                    "end": s[15],
-                    "generation": s[16],
-                    "showInput": s[17],
-                    "language": s[18],
-                    "indent": s[19],
-                    "defaultOpen": bool(s[20]) if s[20] is not None else False
-                }
-                thread_data["steps"].append(step)
-            
-            print(f"[DB] EXIT get_thread -> returning thread with {len(thread_data['steps'])} steps")
+            thread_data["steps"] = steps
+            if steps_cursor:
+                thread_data["stepsCursor"] = steps_cursor
             return thread_data
 
+    async def get_thread_steps(self, thread_id: str, limit: int, before: Optional[str] = None):
+        """
+        Stranica starijih stepova za thread. Vraća (steps, cursor); cursor je None kad nema više.
+        Nepoznat cursor vraća praznu stranicu (nikad ponovno najnovije stepove).
+        """
+        await ensure_db_init()
+        await self._step_writer.flush()
+        async with self._read() as db:
+            return await self._load_steps(db, str(thread_id), limit, before)
+
+    async def _load_steps(self, db, thread_id: str, limit: Optional[int], before: Optional[str]):
+        """Učitava stepove (samo stupce koje UI prikazuje), sortirane po createdAt ASC."""
+        params = [thread_id]
+        where = "threadId = ?"
+        if before:
+            # Cursor nosi (createdAt, id), pa radi i kad je taj step u međuvremenu obrisan
+            before_row = _decode_cursor(before)
+            if before_row is None:
+                # Stari format (samo id)
+                cursor = await db.execute("SELECT createdAt, id FROM steps WHERE id = ?", (before,))
+                before_row = await cursor.fetchone()
+            if not before_row:
+                return [], None
+            where += " AND (createdAt, id) < (?, ?)"
+            params.extend(before_row)
+
+        if limit:
+            # Zadnjih N (+1 da znamo postoje li stariji), pa okreni u ASC
+            cursor = await db.execute(
+                f"SELECT {STEP_COLUMNS} FROM steps WHERE {where} ORDER BY createdAt DESC, id DESC LIMIT ?",
+                (*params, limit + 1)
+            )
+            rows = await cursor.fetchall()
+            has_older = len(rows) > limit
+            rows = rows[:limit]
+            rows.reverse()
+        else:
+            cursor = await db.execute(
+                f"SELECT {STEP_COLUMNS} FROM steps WHERE {where} ORDER BY createdAt ASC, id ASC",
+                tuple(params)
+            )
+            rows = await cursor.fetchall()
+            has_older = False
+
+        steps = [_step_from_row(s) for s in rows]
+        if has_older and steps:
+            return steps, _encode_cursor(steps[0]["createdAt"], steps[0]["id"])
+        return steps, None
+
     async def list_threads(self, pagination, filters):
         print(f"[DB] ENTER list_threads pagination={pagination} filters={filters}")
         await ensure_db_init()
-        async with aiosqlite.connect(self.db_path) as db:
-            query = "SELECT id, createdAt, name, userId, userIdentifier, tags, metadata FROM threads"
+        # Stepovi iz write-behind reda moraju biti vidljivi prije čitanja
+        await self._step_writer.flush()
+        async with self._read() as db:
+            page_size = getattr(pagination, "first", None) or 20
+            columns = "id, createdAt, name, userId, userIdentifier, tags, metadata"
             params = []
             conditions = []
-            
-            # User filter - omogući samo threadove trenutnog korisnika
-            if filters.userId:
-                conditions.append("(userId = ? OR userIdentifier = ?)")
-                params.extend([filters.userId, filters.userId])
+
+            # Keyset paginacija: cursor nosi (createdAt, id) zadnjeg threada s prethodne
+            # stranice, pa radi i kad je taj thread u međuvremenu obrisan
+            raw_cursor = getattr(pagination, "cursor", None)
+            if raw_cursor:
+                cursor_row = _decode_cursor(raw_cursor)
+                if cursor_row is None:
+                    # Stari format (samo id), npr. cursor iz već otvorenog UI-a
+                    cursor = await db.execute("SELECT createdAt, id FROM threads WHERE id = ?", (raw_cursor,))
+                    cursor_row = await cursor.fetchone()
+                if cursor_row:
+                    conditions.append("(createdAt, id) < (?, ?)")
+                    params.extend(cursor_row)
+
             if filters.search:
                 conditions.append("name LIKE ?")
                 params.append(f"%{filters.search}%")
-            
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            
-            query += " ORDER BY createdAt DESC"
-            
-            if hasattr(pagination, 'first') and pagination.first:
-                query += f" LIMIT {pagination.first}"
-            
-            cursor = await db.execute(query, tuple(params))
+
+            order_limit = " ORDER BY createdAt DESC, id DESC LIMIT ?"
+            # Dohvati jedan više da znamo postoji li iduća stranica
+            limit = page_size + 1
+
+            # User filter - omogući samo threadove trenutnog korisnika
+            if filters.userId:
+                # Dva podupita umjesto OR-a: svaki čita svoj indeks već sortiran,
+                # pa trošak ovisi o veličini stranice, ne o broju threadova
+                where = " AND ".join(conditions)
+                where = f" AND {where}" if where else ""
+                query = (
+                    f"SELECT {columns} FROM ("
+                    f"SELECT * FROM (SELECT {columns} FROM threads WHERE userId = ?{where}{order_limit})"
+                    f" UNION "
+                    f"SELECT * FROM (SELECT {columns} FROM threads WHERE userIdentifier = ?{where}{order_limit})"
+                    f"){order_limit}"
+                )
+                query_params = [filters.userId, *params, limit, filters.userId, *params, limit, limit]
+            else:
+                where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+                query = f"SELECT {columns} FROM threads{where}{order_limit}"
+                query_params = [*params, limit]
+
+            cursor = await db.execute(query, tuple(query_params))
             rows = await cursor.fetchall()
+            has_next_page = len(rows) > page_size
+            rows = rows[:page_size]
             
             threads = []
             for row in rows:
@@ -194,11 +352,15 @@ class SQLiteDataLayer(BaseDataLayer):
             # Vraćaj PaginatedResponse objekt, ne dict
             return PaginatedResponse(
                 data=threads, 
-                pageInfo={"hasNextPage": False, "startCursor": None, "endCursor": None}
+                pageInfo={
+                    "hasNextPage": has_next_page,
+                    "startCursor": _encode_cursor(threads[0]["createdAt"], threads[0]["id"]) if threads else None,
+                    "endCursor": _encode_cursor(threads[-1]["createdAt"], threads[-1]["id"]) if threads else None
+                }
             )
 
     async def update_thread(self, thread_id: str, name: Optional[str] = None, user_id: Optional[str] = None, metadata: Optional[Dict] = None, tags: Optional[List[str]] = None):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             if name: 
                 await db.execute("UPDATE threads SET name = ? WHERE id = ?", (name, thread_id))
             if user_id: 
@@ -226,7 +388,7 @@ class SQLiteDataLayer(BaseDataLayer):
         # If incoming userIdentifier is None, empty, or "system", resolve from userId
         if not incoming_user_identifier or incoming_user_identifier == "system":
             if user_id:
-                async with aiosqlite.connect(self.db_path) as db:
+                async with self._read() as db:
                     cursor = await db.execute(
                         "SELECT identifier FROM users WHERE id = ?", 
                         (user_id,)
@@ -243,7 +405,7 @@ class SQLiteDataLayer(BaseDataLayer):
         
         print(f"[DB] create_thread resolved userIdentifier={user_identifier} from userId={user_id} (incoming={incoming_user_identifier})")
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "INSERT INTO threads (id, createdAt, name, userId, userIdentifier, tags, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
                 (thread_id, created_at, name, user_id, user_identifier, tags, metadata)
@@ -253,7 +415,8 @@ class SQLiteDataLayer(BaseDataLayer):
         return thread_id
 
     async def delete_thread(self, thread_id: str):
-        async with aiosqlite.connect(self.db_path) as db:
+        await self._step_writer.flush()
+        async with self._write() as db:
             await db.execute("DELETE FROM steps WHERE threadId = ?", (thread_id,))
             await db.execute("DELETE FROM elements WHERE threadId = ?", (thread_id,))
             await db.execute("DELETE FROM threads WHERE id = ?", (thread_id,))
@@ -261,44 +424,29 @@ class SQLiteDataLayer(BaseDataLayer):
 
     # --- STEP METHODS ---
     async def create_step(self, step_dict: StepDict):
-        await ensure_db_init()
-        async with aiosqlite.connect(self.db_path) as db:
-            # Self-healing: Ako thread ne postoji, kreiraj ga
-            cursor = await db.execute("SELECT 1 FROM threads WHERE id = ?", (step_dict["threadId"],))
-            if not await cursor.fetchone():
-                await db.execute(
-                    "INSERT INTO threads (id, createdAt, name, userIdentifier) VALUES (?, ?, ?, ?)", 
-                    (step_dict["threadId"], datetime.utcnow().isoformat(), "Auto-created", "system")
-                )
-
-            # Mapiranje polja
-            val_id = step_dict.get("id")
-            val_name = step_dict.get("name")
-            val_type = step_dict.get("type")
-            val_thread = step_dict.get("threadId")
-            val_parent = step_dict.get("parentId")
-            val_input = str(step_dict.get("input") or "")
-            val_output = str(step_dict.get("output") or "")
-            val_created = step_dict.get("createdAt") or datetime.utcnow().isoformat()
-            val_meta = json.dumps(step_dict.get("metadata") or {})
-
-            await db.execute(
-                """INSERT OR REPLACE INTO steps (id, name, type, threadId, parentId, input, output, createdAt, metadata)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (val_id, val_name, val_type, val_thread, val_parent, val_input, val_output, val_created, val_meta)
-            )
-            await db.commit()
+        # Write-behind: upis ide u red, flush grupira sve u jednu transakciju
+        self._step_writer.add_insert({
+            "id": step_dict.get("id"),
+            "name": step_dict.get("name"),
+            "type": step_dict.get("type"),
+            "threadId": step_dict.get("threadId"),
+            "parentId": step_dict.get("parentId"),
+            "input": str(step_dict.get("input") or ""),
+            "output": str(step_dict.get("output") or ""),
+            "createdAt": step_dict.get("createdAt") or datetime.utcnow().isoformat(),
+            "metadata": json.dumps(step_dict.get("metadata") or {}),
+        })
 
     async def update_step(self, step_dict: StepDict):
-        async with aiosqlite.connect(self.db_path) as db:
-            if step_dict.get("output"):
-                await db.execute("UPDATE steps SET output = ? WHERE id = ?", (str(step_dict["output"]), step_dict["id"]))
-            if step_dict.get("input"):
-                await db.execute("UPDATE steps SET input = ? WHERE id = ?", (str(step_dict["input"]), step_dict["id"]))
-            await db.commit()
+        self._step_writer.add_update(
+            step_dict["id"],
+            output=str(step_dict["output"]) if step_dict.get("output") else None,
+            input=str(step_dict["input"]) if step_dict.get("input") else None,
+        )
 
     async def delete_step(self, step_id: str):
-        async with aiosqlite.connect(self.db_path) as db:
+        self._step_writer.discard(step_id)
+        async with self._write() as db:
             await db.execute("DELETE FROM steps WHERE id = ?", (step_id,))
             await db.commit()
 
@@ -316,8 +464,10 @@ class SQLiteDataLayer(BaseDataLayer):
         """
         print(f"[DB] ENTER get_thread_author thread_id={thread_id}")
         await ensure_db_init()
+        # Stepovi iz write-behind reda moraju biti vidljivi prije čitanja
+        await self._step_writer.flush()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT userId, userIdentifier FROM threads WHERE id = ?", 
                 (str(thread_id),)
@@ -2,6 +2,7 @@ import aiosqlite
 import logging
 import asyncio
 from pathlib import Path
+from typing import Optional
 
 # DB path stabilizacija - apsolutni path u root projekta
 # db.py je u app/ui/, pa trebamo ići 2 razine gore do root-a
@@ -15,114 +16,178 @@ print(f"[DB] DB path: {DB_NAME}")
 _db_initialized = False
 _db_init_lock = asyncio.Lock()
 
+# Dijeljena konekcija za data layer (otvara se jednom po procesu)
+_connection: Optional[aiosqlite.Connection] = None
+_connection_lock = asyncio.Lock()
+# Serijalizira višestruke write naredbe + commit na dijeljenoj konekciji
+write_lock = asyncio.Lock()
+
+# PRAGMA postavke za dugoživuću konekciju (samo performanse; foreign_keys ostaje
+# isključen kao i na dosadašnjim konekcijama po pozivu, semantika se ne mijenja)
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA mmap_size = 268435456;",  # 256 MB
+    "PRAGMA cache_size = -16000;",    # ~16 MB
+]
+
+# --- MIGRACIJE ---
+# Svaka migracija se izvršava točno jednom; verzija sheme se čuva u PRAGMA user_version.
+# Nove migracije se dodaju NA KRAJ liste MIGRATIONS s idućim brojem verzije.
+
+async def _migration_001_tables(db: aiosqlite.Connection):
+    """Osnovne Chainlit tablice"""
+    # Kreiranje tablice users
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            identifier TEXT UNIQUE NOT NULL,
+            metadata TEXT,
+            createdAt TEXT NOT NULL
+        )
+    """)
+
+    # Kreiranje tablice threads
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS threads (
+            id TEXT PRIMARY KEY,
+            createdAt TEXT NOT NULL,
+            name TEXT,
+            userId TEXT,
+            userIdentifier TEXT,
+            tags TEXT,
+            metadata TEXT,
+            FOREIGN KEY (userId) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Kreiranje tablice steps
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS steps (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            type TEXT NOT NULL,
+            threadId TEXT NOT NULL,
+            parentId TEXT,
+            disableFeedback INTEGER DEFAULT 0,
+            streaming INTEGER DEFAULT 0,
+            waitForAnswer INTEGER DEFAULT 0,
+            isError INTEGER DEFAULT 0,
+            metadata TEXT,
+            tags TEXT,
+            input TEXT,
+            output TEXT,
+            createdAt TEXT NOT NULL,
+            start TEXT,
+            end TEXT,
+            generation TEXT,
+            showInput TEXT,
+            language TEXT,
+            indent INTEGER,
+            defaultOpen INTEGER,
+            FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Kreiranje tablice elements
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS elements (
+            id TEXT PRIMARY KEY,
+            threadId TEXT NOT NULL,
+            type TEXT NOT NULL,
+            url TEXT,
+            chainlitKey TEXT,
+            name TEXT NOT NULL,
+            display TEXT,
+            objectKey TEXT,
+            size TEXT,
+            mime TEXT,
+            path TEXT,
+            language TEXT,
+            forId TEXT,
+            props TEXT,
+            FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Kreiranje tablice feedbacks
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS feedbacks (
+            id TEXT PRIMARY KEY,
+            forId TEXT,
+            threadId TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            comment TEXT,
+            FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
+        )
+    """)
+
+async def _migration_002_indexes(db: aiosqlite.Connection):
+    """Indeksi za sidebar (list_threads) i učitavanje stepova (get_thread)"""
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_threads_user_created ON threads (userId, createdAt, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_threads_identifier_created ON threads (userIdentifier, createdAt, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_threads_created ON threads (createdAt, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_steps_thread_created ON steps (threadId, createdAt)")
+
+async def _migration_003_backfill_user_identifier(db: aiosqlite.Connection):
+    """Jednokratni backfill userIdentifier (uključujući legacy 'system' threadove)"""
+    # Popuni userIdentifier za postojeće threadove
+    cursor = await db.execute("""
+        UPDATE threads 
+        SET userIdentifier = (
+            SELECT users.identifier 
+            FROM users 
+            WHERE users.id = threads.userId
+        ) 
+        WHERE (userIdentifier IS NULL OR userIdentifier = 'system') AND userId IS NOT NULL
+    """)
+    migrated_count = cursor.rowcount
+    if migrated_count > 0:
+        print(f"[DB] Migrated {migrated_count} threads with userIdentifier (including system -> proper identifier)")
+
+async def _migration_004_steps_keyset_index(db: aiosqlite.Connection):
+    """Indeks za keyset stranice stepova (createdAt, id) unutar threada"""
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_steps_thread_created_id ON steps (threadId, createdAt, id)")
+    await db.execute("DROP INDEX IF EXISTS idx_steps_thread_created")
+
+MIGRATIONS = [
+    (1, "tables", _migration_001_tables),
+    (2, "indexes", _migration_002_indexes),
+    (3, "backfill userIdentifier", _migration_003_backfill_user_identifier),
+    (4, "steps keyset index", _migration_004_steps_keyset_index),
+]
+
 async def init_db():
-    """Inicijalizacija SQLite baze s potrebnim tablicama za Chainlit"""
-    print(f"[DB] Inicijaliziram DB: {DB_NAME}")
+    """
+    Inicijalizacija SQLite baze: pokreće samo migracije novije od PRAGMA user_version.
+    Kad je shema ažurna, ovo je jedan PRAGMA upit neovisno o veličini povijesti.
+    """
     async with aiosqlite.connect(DB_NAME) as db:
         # Omogući Foreign Keys
         await db.execute("PRAGMA foreign_keys = ON;")
 
-        # Kreiranje tablice users
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                identifier TEXT UNIQUE NOT NULL,
-                metadata TEXT,
-                createdAt TEXT NOT NULL
-            )
-        """)
-        
-        # Kreiranje tablice threads
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS threads (
-                id TEXT PRIMARY KEY,
-                createdAt TEXT NOT NULL,
-                name TEXT,
-                userId TEXT,
-                userIdentifier TEXT,
-                tags TEXT,
-                metadata TEXT,
-                FOREIGN KEY (userId) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Kreiranje tablice steps
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS steps (
-                id TEXT PRIMARY KEY,
-                name TEXT,
-                type TEXT NOT NULL,
-                threadId TEXT NOT NULL,
-                parentId TEXT,
-                disableFeedback INTEGER DEFAULT 0,
-                streaming INTEGER DEFAULT 0,
-                waitForAnswer INTEGER DEFAULT 0,
-                isError INTEGER DEFAULT 0,
-                metadata TEXT,
-                tags TEXT,
-                input TEXT,
-                output TEXT,
-                createdAt TEXT NOT NULL,
-                start TEXT,
-                end TEXT,
-                generation TEXT,
-                showInput TEXT,
-                language TEXT,
-                indent INTEGER,
-                defaultOpen INTEGER,
-                FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Kreiranje tablice elements
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS elements (
-                id TEXT PRIMARY KEY,
-                threadId TEXT NOT NULL,
-                type TEXT NOT NULL,
-                url TEXT,
-                chainlitKey TEXT,
-                name TEXT NOT NULL,
-                display TEXT,
-                objectKey TEXT,
-                size TEXT,
-                mime TEXT,
-                path TEXT,
-                language TEXT,
-                forId TEXT,
-                props TEXT,
-                FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Kreiranje tablice feedbacks
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS feedbacks (
-                id TEXT PRIMARY KEY,
-                forId TEXT,
-                threadId TEXT NOT NULL,
-                value INTEGER NOT NULL,
-                comment TEXT,
-                FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
-            )
-        """)
-        
-        # One-time migration: Popuni userIdentifier za postojeće threadove
-        cursor = await db.execute("""
-            UPDATE threads 
-            SET userIdentifier = (
-                SELECT users.identifier 
-                FROM users 
-                WHERE users.id = threads.userId
-            ) 
-            WHERE (userIdentifier IS NULL OR userIdentifier = 'system') AND userId IS NOT NULL
-        """)
-        migrated_count = cursor.rowcount
-        if migrated_count > 0:
-            print(f"[DB] Migrated {migrated_count} threads with userIdentifier (including system -> proper identifier)")
-        
-        await db.commit()
-        print("[DB] init_db complete (tables ensured: users, threads, steps, elements, feedbacks)")
+        cursor = await db.execute("PRAGMA user_version")
+        current_version = (await cursor.fetchone())[0]
+        pending = [m for m in MIGRATIONS if m[0] > current_version]
+        if not pending:
+            print(f"[DB] Shema ažurna (verzija {current_version}): {DB_NAME}")
+            return
+
+        print(f"[DB] Inicijaliziram DB: {DB_NAME} (verzija {current_version} -> {pending[-1][0]})")
+        for version, name, migrate in pending:
+            # Migracija i nova verzija se commitaju zajedno
+            await db.execute("BEGIN")
+            try:
+                await migrate(db)
+                await db.execute(f"PRAGMA user_version = {version}")
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            print(f"[DB] Migracija {version} ({name}) primijenjena")
+
+        print("[DB] init_db complete")
 
 async def ensure_db_init() -> None:
     global _db_initialized
@@ -132,4 +197,31 @@ async def ensure_db_init() -> None:
         if _db_initialized:
             return
         await init_db()
-        _db_initialized = True
\ No newline at end of file
+        _db_initialized = True
+
+async def get_connection() -> aiosqlite.Connection:
+    """
+    Vraća dijeljenu aiosqlite konekciju (WAL, synchronous=NORMAL, mmap).
+    sqlite3 kešira pripremljene naredbe po konekciji, pa ih dugoživuća
+    konekcija stvarno ponovno koristi.
+    """
+    global _connection
+    if _connection is not None:
+        return _connection
+    await ensure_db_init()
+    async with _connection_lock:
+        if _connection is None:
+            conn = await aiosqlite.connect(DB_NAME, cached_statements=256)
+            for pragma in CONNECTION_PRAGMAS:
+                await conn.execute(pragma)
+            _connection = conn
+            print(f"[DB] Otvorena dijeljena konekcija: {DB_NAME}")
+    return _connection
+
+async def close_connection() -> None:
+    """Zatvara dijeljenu konekciju (npr. pri gašenju aplikacije)."""
+    global _connection
+    async with _connection_lock:
+        if _connection is not None:
+            await _connection.close()
+            _connection = None
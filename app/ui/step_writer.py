@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.ui.db import get_connection, write_lock
+
+STEP_INSERT_SQL = """INSERT OR REPLACE INTO steps (id, name, type, threadId, parentId, input, output, createdAt, metadata)
+                     VALUES (:id, :name, :type, :threadId, :parentId, :input, :output, :createdAt, :metadata)"""
+
+
+class StepWriteBehind:
+    """
+    Write-behind red za stepove.
+
+    create_step/update_step samo upisuju u memoriju; pozadinski task svakih
+    `flush_interval` sekundi zapiše sve u jednoj transakciji. Više updateova
+    istog stepa spaja se u jedan zapis (zadnja vrijednost pobjeđuje), a update
+    stepa koji još nije upisan spaja se direktno u njegov INSERT.
+    Ako zapis ne uspije, batch se vraća u red i ponavlja s rastućom pauzom.
+    """
+
+    def __init__(self, flush_interval: float = 0.05, max_pending: int = 500, max_retry_delay: float = 5.0):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retry_delay = max_retry_delay
+        self._inserts: Dict[str, dict] = {}
+        self._updates: Dict[str, dict] = {}
+        # Batch koji se upravo zapisuje (vraća se u red ako zapis ne uspije)
+        self._inflight_inserts: Dict[str, dict] = {}
+        self._inflight_updates: Dict[str, dict] = {}
+        self._failures = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._inserts) + len(self._updates)
+
+    def add_insert(self, row: dict):
+        # INSERT OR REPLACE zamjenjuje sve ranije updateove tog stepa
+        self._updates.pop(row["id"], None)
+        self._inserts[row["id"]] = row
+        self._schedule()
+
+    def add_update(self, step_id: str, output: Optional[str] = None, input: Optional[str] = None):
+        target = self._inserts.get(step_id)
+        if target is None:
+            target = self._updates.setdefault(step_id, {})
+        if output:
+            target["output"] = output
+        if input:
+            target["input"] = input
+        self._schedule()
+
+    def discard(self, step_id: str):
+        """Briše step iz reda (npr. prije DELETE, da ga kasniji flush ne vrati)."""
+        self._inserts.pop(step_id, None)
+        self._updates.pop(step_id, None)
+        self._inflight_inserts.pop(step_id, None)
+        self._inflight_updates.pop(step_id, None)
+
+    def _schedule(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        delay = 0 if self.pending >= self.max_pending else self.flush_interval
+        self._flush_task = asyncio.create_task(self._delayed_flush(delay))
+
+    async def _delayed_flush(self, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            print(f"[DB] StepWriteBehind flush FAILED (pokušaj {self._failures}, batch vraćen u red): {e}")
+        # Sve što je stiglo tijekom flusha (ili neuspjeli batch) ide u idući batch
+        if self.pending:
+            delay = self.flush_interval
+            if self._failures:
+                delay = min(self.flush_interval * 2 ** self._failures, self.max_retry_delay)
+            self._flush_task = asyncio.create_task(self._delayed_flush(delay))
+
+    def _requeue(self, inserts: Dict[str, dict], updates: Dict[str, dict]):
+        """Vraća neuspjeli batch u red; noviji zapisi istog stepa imaju prednost."""
+        for step_id, row in inserts.items():
+            if step_id in self._inserts:
+                # Noviji INSERT OR REPLACE ionako zamjenjuje cijeli red
+                continue
+            newer = self._updates.pop(step_id, None) or {}
+            self._inserts[step_id] = {**row, **newer}
+        for step_id, fields in updates.items():
+            if step_id in self._inserts:
+                continue
+            newer = self._updates.get(step_id) or {}
+            self._updates[step_id] = {**fields, **newer}
+
+    async def flush(self):
+        """Zapisuje sve stepove iz reda u jednoj transakciji."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            inserts, updates = self._inserts, self._updates
+            self._inserts, self._updates = {}, {}
+            self._inflight_inserts, self._inflight_updates = inserts, updates
+
+            try:
+                await self._write(inserts, updates)
+            except Exception:
+                self._requeue(self._inflight_inserts, self._inflight_updates)
+                raise
+            finally:
+                self._inflight_inserts, self._inflight_updates = {}, {}
+
+    async def _write(self, inserts: Dict[str, dict], updates: Dict[str, dict]):
+        db = await get_connection()
+        async with write_lock:
+            try:
+                if inserts:
+                    # Self-healing: ako thread ne postoji, kreiraj ga
+                    now = datetime.utcnow().isoformat()
+                    await db.executemany(
+                        "INSERT OR IGNORE INTO threads (id, createdAt, name, userIdentifier) VALUES (?, ?, ?, ?)",
+                        [(tid, now, "Auto-created", "system") for tid in {r["threadId"] for r in inserts.values()}]
+                    )
+                    await db.executemany(STEP_INSERT_SQL, list(inserts.values()))
+                outputs = [(u["output"], sid) for sid, u in updates.items() if "output" in u]
+                if outputs:
+                    await db.executemany("UPDATE steps SET output = ? WHERE id = ?", outputs)
+                inputs = [(u["input"], sid) for sid, u in updates.items() if "input" in u]
+                if inputs:
+                    await db.executemany("UPDATE steps SET input = ? WHERE id = ?", inputs)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+    async def close(self):
+        """Zapisuje preostale stepove; poziva se pri gašenju."""
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
@@ -0,0 +1,128 @@
+"""
+Simulates N users sending a message at the same time and measures how long
+until every chat has its answer.
+
+- blocking: what main() used to do (sync rag_engine.query + llm.invoke inside
+  the async handler), so chats are served one after another.
+- async:    what main() does now: app.rag.retrieval.retrieve_context (the
+  code behind chat._retrieve_context) and a streamed answer (llm.astream).
+
+Embedding and LLM latency are simulated with sleeps, no API key needed.
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import argparse
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.embeddings import Embeddings
+
+from app.rag.context import ContextAssembler
+from app.rag.embeddings import HashEmbeddings
+from app.rag.engine import RagEngine
+from app.rag.retrieval import retrieve_context
+
+
+class SlowEmbeddings(Embeddings):
+    """HashEmbeddings with an artificial per-call delay (like a remote API)."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.inner = HashEmbeddings()
+        self.query_calls = 0
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        time.sleep(self.delay)
+        return self.inner.embed_query(text)
+
+
+class SlowLLM:
+    """Stand-in for ChatGoogleGenerativeAI with a fixed response time."""
+
+    def __init__(self, delay: float, chunks: int = 20):
+        self.delay = delay
+        self.chunks = chunks
+
+    def invoke(self, messages):
+        time.sleep(self.delay)
+        return "ok"
+
+    async def astream(self, messages):
+        # Same total time as invoke(), spread over the streamed chunks
+        for _ in range(self.chunks):
+            await asyncio.sleep(self.delay / self.chunks)
+            yield "ok "
+
+
+def slow_inventory_lookup(delay: float):
+    time.sleep(delay)
+    return []
+
+
+async def blocking_chat(engine, assembler, llm, question, inventory_delay):
+    engine.query(question)
+    slow_inventory_lookup(inventory_delay)
+    return llm.invoke([question])
+
+
+async def async_chat(engine, assembler, llm, question, inventory_delay):
+    await retrieve_context(engine, assembler, question,
+                           lambda: asyncio.to_thread(slow_inventory_lookup, inventory_delay))
+    return "".join([chunk async for chunk in llm.astream([question])])
+
+
+async def run(handler, engine, assembler, llm, users, inventory_delay):
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        handler(engine, assembler, llm, f"how do I check disk usage on server {i}?", inventory_delay)
+        for i in range(users)
+    ))
+    return time.perf_counter() - start
+
+
+def build_engine(tmp: str, embed_latency: float) -> RagEngine:
+    md_path = os.path.join(tmp, "runbook.md")
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write("# Disk\nUse `df -h` to check disk usage.\n\n# Memory\nUse `free -m`.\n")
+    engine = RagEngine(persist_directory=os.path.join(tmp, "chroma"), embeddings=SlowEmbeddings(embed_latency))
+    engine.ingest_markdown(md_path)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chat latency benchmark")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--inventory-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    single = args.embed_latency + args.inventory_latency + args.llm_latency
+    print(f"\n{args.users} simultaneous chats, single chat ~{single:.2f}s\n")
+    os.environ.setdefault("RAG_QUERY_WORKERS", str(max(8, args.users)))
+    llm = SlowLLM(args.llm_latency)
+    assembler = ContextAssembler()
+
+    for name, handler in (("blocking", blocking_chat), ("async", async_chat)):
+        # Fresh persist dir per run: no warm query cache and no warm on-disk
+        # embedding cache, so every run pays for retrieval
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_engine(tmp, args.embed_latency)
+            elapsed = asyncio.run(run(handler, engine, assembler, llm, args.users, args.inventory_latency))
+            engine._executor.shutdown(wait=True)
+            embed_calls = engine.embeddings.inner.query_calls
+        print(f"{name:<10} {elapsed:6.2f}s total ({elapsed / single:4.1f}x single-chat latency), "
+              f"{embed_calls / args.users:.1f} embedding calls per chat")
+
+
+if __name__ == "__main__":
+    main()
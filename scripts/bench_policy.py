@@ -0,0 +1,66 @@
+import re
+import sys
+import os
+import random
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.security.policy import BLACKLISTED_COMMANDS, check_command, get_policy
+
+# Typical commands the agent proposes during a fan-out
+SAMPLE_COMMANDS = [
+    "df -h",
+    "uptime",
+    "free -m | grep Mem",
+    "systemctl status nginx && journalctl -u nginx -n 50",
+    "cat /etc/os-release; uname -a",
+    "ls -la /var/log | tail -n 20",
+    "echo $(hostname) `whoami`",
+    "show ip interface brief",
+    "show vlan brief | include active",
+    "display interface brief",
+    "show running-config | section interface",
+    "rm -rf /tmp/cache",
+    "sudo reboot",
+]
+
+
+def legacy_validate(command: str):
+    """The previous implementation: uncompiled re.search per pattern."""
+    for pattern in BLACKLISTED_COMMANDS:
+        if re.search(pattern, command):
+            return False
+    return True
+
+
+def bench(label, fn, commands):
+    start = time.perf_counter()
+    for cmd in commands:
+        fn(cmd)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:8.1f} ms  ({elapsed / len(commands) * 1e6:6.2f} us/cmd)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    random.seed(42)
+    # Mostly repeated commands (fan-out) with a share of unique ones
+    commands = [
+        random.choice(SAMPLE_COMMANDS) if random.random() < 0.8 else f"grep -c error /var/log/app-{i}.log"
+        for i in range(n)
+    ]
+
+    print(f"Validating {n} commands")
+    print("-" * 30)
+    bench("legacy re.search loop", legacy_validate, commands)
+    policy = get_policy("linux")
+    bench("compiled policy (no cache)", policy.evaluate, commands)
+    check_command.cache_clear()
+    bench("check_command (memoized)", lambda c: check_command(c, "linux"), commands)
+    print(check_command.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,106 @@
 import sys
 import os
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.rag.engine import RagEngine
+from app.rag.engine import RagEngine, file_sha256
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python ingest.py <filename>")
-        print("  <filename> should be inside app/knowledge_base/")
-        sys.exit(1)
+KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'knowledge_base')
+SUPPORTED_EXTENSIONS = ('.pdf', '.md')
+
+
+def ingest_file(engine: RagEngine, file_path: str, backend: str = None) -> int:
+    if file_path.lower().endswith('.pdf'):
+        return engine.ingest_document(file_path, backend=backend)
+    return engine.ingest_markdown(file_path)
+
+
+def find_files(directory: str) -> list:
+    """All PDF and Markdown files under `directory`, sorted for stable runs."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def _ingest_one(engine: RagEngine, file_path: str, backend: str) -> dict:
+    result = {"path": file_path, "bytes": os.path.getsize(file_path), "chunks": 0}
+    start = time.perf_counter()
+    try:
+        # Files finished by an earlier (possibly interrupted) run are in the
+        # engine's ingest manifest with the same hash
+        if engine.is_unchanged(file_path, file_sha256(file_path)):
+            result["status"] = "skipped"
+        else:
+            result["chunks"] = ingest_file(engine, file_path, backend)
+            result["status"] = "ingested"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def bulk_ingest(directory: str, workers: int = 4, backend: str = None) -> dict:
+    """
+    Ingests every PDF/Markdown file under `directory` with up to `workers`
+    files in flight. Progress goes to stderr; returns the run summary.
+    Each finished file is recorded in the ingest manifest right away, so an
+    interrupted run picks up where it stopped.
+    """
+    files = find_files(directory)
+    engine = RagEngine()
+    results = []
+    total_bytes = 0
+    total_chunks = 0
+    start = time.perf_counter()
+
+    print(f"Ingesting {len(files)} files from {directory} with {workers} workers...", file=sys.stderr)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = [pool.submit(_ingest_one, engine, path, backend) for path in files]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            total_chunks += result["chunks"]
+            if result["status"] == "ingested":
+                total_bytes += result["bytes"]
+            elapsed = time.perf_counter() - start
+            print(
+                f"[{done}/{len(files)}] {result['status']:<8} {os.path.relpath(result['path'], directory)} "
+                f"({result['chunks']} chunks, {result['seconds']:.1f}s) | "
+                f"{done / elapsed:.2f} files/s, {total_chunks / elapsed:.1f} chunks/s, "
+                f"{total_bytes / elapsed / 1e6:.2f} MB/s",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        print("Interrupted; finished files are saved, re-run to continue.", file=sys.stderr)
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
 
-    filename = sys.argv[1]
-    base_dir = os.path.join(os.path.dirname(__file__), '..', 'app', 'knowledge_base')
+    elapsed = time.perf_counter() - start
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("ingested", "skipped", "failed")}
+    return {
+        "directory": os.path.abspath(directory),
+        "workers": workers,
+        "backend": backend or os.getenv("PDF_BACKEND", "llamaparse"),
+        "elapsed_seconds": round(elapsed, 3),
+        "files": sorted(results, key=lambda r: r["path"]),
+        "totals": {"files": len(files), "chunks": total_chunks, "bytes_ingested": total_bytes, **counts},
+    }
+
+
+def ingest_single(filename: str, backend: str = None):
+    base_dir = KNOWLEDGE_BASE_DIR
     file_path = os.path.join(base_dir, filename)
 
     print(f"Targeting file: {file_path}")
@@ -22,22 +109,51 @@ def main():
         print(f"File not found: {file_path}")
         sys.exit(1)
 
+    if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        print("Unknown file type. Only .pdf and .md supported.")
+        sys.exit(1)
+
     engine = RagEngine()
-    
-    try:
-        if filename.lower().endswith('.pdf'):
-            print("Detected PDF. Using Document Ingestion...")
-            count = engine.ingest_document(file_path)
-        elif filename.lower().endswith('.md'):
-            print("Detected Markdown. Using Markdown Ingestion...")
-            count = engine.ingest_markdown(file_path)
-        else:
-            print("Unknown file type. Only .pdf and .md supported.")
-            sys.exit(1)
 
+    try:
+        print(f"Detected {'PDF' if filename.lower().endswith('.pdf') else 'Markdown'}. Ingesting...")
+        count = ingest_file(engine, file_path, backend)
         print(f"DONE. Ingested {count} chunks.")
     except Exception as e:
         print(f"Ingestion FAILED: {e}")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest knowledge base files into the RAG index")
+    parser.add_argument("filename", nargs="?", help="single file inside app/knowledge_base/")
+    parser.add_argument("--all", action="store_true", help="ingest every .pdf/.md file under --dir")
+    parser.add_argument("--dir", default=KNOWLEDGE_BASE_DIR, help="directory for --all (default: app/knowledge_base)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="files ingested concurrently (default: 4); PDF pages share one pool of PDF_WORKERS processes")
+    parser.add_argument("--backend", choices=("llamaparse", "pypdf"), help="PDF backend (default: PDF_BACKEND or llamaparse)")
+    parser.add_argument("--summary", help="write the JSON summary to this file instead of stdout")
+    args = parser.parse_args()
+
+    if not args.all:
+        if not args.filename:
+            parser.print_usage()
+            print("  <filename> should be inside app/knowledge_base/, or use --all")
+            sys.exit(1)
+        ingest_single(args.filename, args.backend)
+        return
+
+    # Keep stdout for the JSON summary; engine logs go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        summary = bulk_ingest(args.dir, workers=args.workers, backend=args.backend)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.summary}", file=sys.stderr)
+    else:
+        print(json.dumps(summary, indent=2))
+    if summary["totals"]["failed"]:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
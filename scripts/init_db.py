@@ -21,8 +21,10 @@ def main():
     if os.path.exists(csv_path):
         print(f"Importing inventory from {csv_path}...")
         try:
-            count = repo.bulk_import_from_csv(csv_path)
-            print(f"Successfully imported {count} devices.")
+            report = repo.bulk_import_from_csv(csv_path)
+            print(f"Successfully imported {report['inserted']} of {report['rows']} devices.")
+            for rejected in report["rejected"]:
+                print(f"  Rejected line {rejected['row']} ({rejected['hostname']}): {rejected['reason']}")
         except Exception as e:
             print(f"Failed to import CSV: {e}")
     else:
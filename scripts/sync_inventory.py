@@ -0,0 +1,38 @@
+import sys
+import os
+import argparse
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.data.inventory_repo import InventoryRepository
+
+
+def print_report(report: dict):
+    print(f"{'DRY RUN - nothing written' if report['dry_run'] else 'Applied'} ({report['rows']} CSV rows)")
+    for key in ("inserted", "updated", "removed"):
+        print(f"  {key:<9} {len(report[key])}")
+        for hostname in report[key]:
+            print(f"    {hostname}")
+    print(f"  unchanged {report['unchanged']}")
+    print(f"  rejected  {len(report['rejected'])}")
+    for rejected in report["rejected"]:
+        print(f"    line {rejected['row']} ({rejected['hostname']}): {rejected['reason']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the device inventory with a full CSV export")
+    parser.add_argument("csv_path", help="CSV with the complete inventory")
+    parser.add_argument("--db", default="inventory.db", help="inventory database (default: inventory.db)")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: dry run)")
+    parser.add_argument("--keep-missing", action="store_true", help="do not remove devices missing from the CSV")
+    args = parser.parse_args()
+
+    repo = InventoryRepository(args.db)
+    repo.initialize_db()
+    report = repo.sync_from_csv(args.csv_path, dry_run=not args.apply, remove_missing=not args.keep_missing)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()